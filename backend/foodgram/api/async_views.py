@@ -0,0 +1,230 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from recipes.constants import (
+    IMAGE_SIZE_PARAM, INGREDIENT_INDEX_VERSION_KEY, REFERENCE_MAX_AGE)
+from recipes.models import Tag
+
+from . import views
+from .authentication import CachedTokenAuthentication
+from .autocomplete import ingredient_index
+from .cache import (
+    REFERENCE_KEY, TAGS_VERSION_KEY, aget_recipe_fragments,
+    aget_rendered_response, aget_versions, aset_rendered_response,
+    fragment_version_keys)
+from .conditional import aconditional_response, make_etag
+from .filters import RecipeFilter
+from .metrics import timed_serialization
+from .pagination import CustomPagination
+from .serializers import RecipeGetSerializer, TagSerializer
+from .shortlinks import aresolve_short_link
+
+SAFE_METHODS = ('GET', 'HEAD')
+JSON_MEDIA_TYPES = ('application/json', 'application/*', '*/*')
+RECIPE_LIST_PARAMS = {'page', 'limit', 'tags', 'tags_match', 'author',
+                      IMAGE_SIZE_PARAM}
+
+renderer = JSONRenderer()
+authentication = CachedTokenAuthentication()
+
+
+class Delegate(Exception):
+    """Запрос не поддерживается асинхронной вьюхой: отдать синхронной."""
+
+
+def with_fallback(sync_view):
+    """
+    Асинхронная вьюха с синхронной DRF-вьюхой в запасе.
+
+    Асинхронно обрабатываются только GET и HEAD в частых вариантах;
+    остальные методы и все, на чем вьюха бросает Delegate, уходят
+    в sync_view, так что ответы и ошибки совпадают с WSGI-режимом.
+    """
+    fallback = sync_to_async(sync_view)
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method in SAFE_METHODS:
+                try:
+                    return await view(request, *args, **kwargs)
+                except Delegate:
+                    pass
+            return await fallback(request, *args, **kwargs)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+async def check_api_request(request, anonymous=False):
+    """
+    Пропускает только JSON-запросы без ?format, с валидным токеном
+    или без него; anonymous=True требует запроса без токена.
+    """
+    accept = request.headers.get('Accept', '')
+    if 'format' in request.GET or accept and (
+            'text/html' in accept or 'indent=' in accept
+            or not any(media in accept for media in JSON_MEDIA_TYPES)):
+        raise Delegate
+    try:
+        user = await authentication.aauthenticate(request)
+    except exceptions.AuthenticationFailed:
+        raise Delegate
+    if anonymous and user is not None:
+        raise Delegate
+
+
+def json_response(content):
+    return HttpResponse(content, content_type='application/json')
+
+
+def finalize_response(response, allow):
+    """Заголовки, которые DRF добавляет к ответам вьюсета, включая 304."""
+    response['Allow'] = allow
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+async def reference_response(request, version_key, get_data):
+    """Асинхронный вариант VersionedReferenceMixin.reference_response."""
+    version, = await aget_versions(version_key)
+
+    async def rendered_response():
+        if request.GET:
+            return json_response(renderer.render(await get_data()))
+        key = REFERENCE_KEY.format(
+            version_key=version_key, version=version, path=request.path)
+        content = await aget_rendered_response(key)
+        if content is None:
+            content = renderer.render(await get_data())
+            await aset_rendered_response(key, content)
+        return json_response(content)
+
+    etag = make_etag(
+        version_key, version, request.get_full_path(), renderer.media_type)
+    response = await aconditional_response(
+        request, etag, None, rendered_response, vary=())
+    patch_cache_control(response, public=True, max_age=REFERENCE_MAX_AGE)
+    return finalize_response(response, 'GET, HEAD, OPTIONS')
+
+
+@with_fallback(views.TagViewSet.as_view(
+    {'get': 'list'}, basename='tag', detail=False))
+async def tag_list(request):
+    await check_api_request(request)
+
+    async def get_data():
+        return TagSerializer(
+            [tag async for tag in Tag.objects.all()], many=True).data
+
+    return await reference_response(request, TAGS_VERSION_KEY, get_data)
+
+
+@with_fallback(views.TagViewSet.as_view(
+    {'get': 'retrieve'}, basename='tag', detail=True))
+async def tag_detail(request, pk):
+    await check_api_request(request)
+
+    # Тег проверяется до ETag: иначе на несуществующий тег с ETag
+    # справочника пришел бы 304 вместо 404.
+    tag = await Tag.objects.filter(pk=pk).afirst()
+    if tag is None:
+        raise Delegate
+
+    async def get_data():
+        return TagSerializer(tag).data
+
+    return await reference_response(request, TAGS_VERSION_KEY, get_data)
+
+
+@with_fallback(views.IngredientViewSet.as_view(
+    {'get': 'list'}, basename='ingredient', detail=False))
+async def ingredient_list(request):
+    """Автодополнение из индекса в памяти без потоков и запросов к БД."""
+    await check_api_request(request)
+    name = request.GET.get('name')
+
+    async def get_data():
+        if name:
+            return await ingredient_index.asearch(name)
+        return await ingredient_index.aall()
+
+    return await reference_response(
+        request, INGREDIENT_INDEX_VERSION_KEY, get_data)
+
+
+def select_page(request):
+    """
+    Страница ленты и поля ответа вне results: RecipeFilter и
+    CustomPagination, как в RecipeViewSet.list. Ошибки параметров
+    отдает синхронной вьюхе.
+    """
+    drf_request = Request(request)
+    filterset = RecipeFilter(
+        request.GET,
+        views.anonymous_validators_queryset().only(
+            *views.RECIPE_STATE_FIELDS),
+        request=drf_request
+    )
+    if not filterset.is_valid():
+        raise Delegate
+    paginator = CustomPagination()
+    try:
+        recipes = paginator.paginate_queryset(filterset.qs, drf_request)
+    except exceptions.NotFound:
+        raise Delegate
+    return recipes, paginator.get_paginated_response(None).data
+
+
+async def recipe_page(request, recipes, envelope):
+    serializer = RecipeGetSerializer(context={'request': Request(request)})
+    fragments = await aget_recipe_fragments(
+        recipes, serializer.build_fragments)
+    results = []
+    with timed_serialization():
+        for recipe in recipes:
+            results.append(
+                serializer.merge_user_data(recipe, fragments[recipe.pk]))
+    return json_response(renderer.render({**envelope, 'results': results}))
+
+
+@with_fallback(views.RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipe', detail=False))
+async def recipe_list(request):
+    """
+    Лента рецептов для анонима: ETag и тело совпадают с синхронной
+    вьюхой, фрагменты берутся из кэша. В поток уходят фильтры и
+    пагинация (те же RecipeFilter и CustomPagination) и сборка
+    недостающих фрагментов. Запросы с токеном, поиском и курсорной
+    пагинацией обрабатывает RecipeViewSet.
+    """
+    await check_api_request(request, anonymous=True)
+    if not RECIPE_LIST_PARAMS.issuperset(request.GET):
+        raise Delegate
+    recipes, envelope = await sync_to_async(select_page)(request)
+    etag = views.recipe_list_etag(
+        recipes, envelope,
+        await aget_versions(*fragment_version_keys(recipes))
+    )
+    response = await aconditional_response(
+        request, etag, None,
+        lambda: recipe_page(request, recipes, envelope)
+    )
+    return finalize_response(response, 'GET, POST, HEAD, OPTIONS')
+
+
+@with_fallback(views.redirect_short_link)
+async def redirect_short_link(request, short_link):
+    recipe_id = await aresolve_short_link(short_link)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}/')
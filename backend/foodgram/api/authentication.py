@@ -0,0 +1,137 @@
+from hashlib import sha256
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication, get_authorization_header)
+from rest_framework.permissions import SAFE_METHODS
+
+from recipes.constants import (
+    AUTH_TOKEN_CACHE_TIMEOUT, AUTH_TOKEN_LRU_SIZE, AUTH_TOKEN_LRU_TIMEOUT)
+
+from .cache import LRUCache, is_shared_cache
+
+User = get_user_model()
+
+AUTH_TOKEN_KEY = 'auth-token:{digest}'
+USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != 'password'
+]
+
+local_cache = LRUCache(AUTH_TOKEN_LRU_SIZE, AUTH_TOKEN_LRU_TIMEOUT)
+
+
+def token_cache_key(key):
+    """Ключ кэша по хэшу токена, чтобы сами токены не лежали в Redis."""
+    return AUTH_TOKEN_KEY.format(digest=sha256(key.encode()).hexdigest())
+
+
+def use_snapshot(request):
+    return request.method in SAFE_METHODS and is_shared_cache()
+
+
+def forget_token(key):
+    cache_key = token_cache_key(key)
+    local_cache.delete(cache_key)
+    cache.delete(cache_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к БД на каждый запрос на чтение.
+
+    Снимок пользователя по токену хранится в LRU процесса и в общем
+    кэше. Снимок удаляется сигналами при удалении токена (выход через
+    djoser) и любом изменении пользователя; в LRU других процессов
+    старый снимок живет не дольше AUTH_TOKEN_LRU_TIMEOUT секунд.
+
+    Снимок используется, только если кэш общий для всех процессов:
+    с кэшем в памяти процесса сигнал не дойдет до других воркеров и
+    отозванный токен будет работать до истечения кэша. Запросы,
+    которые могут менять данные, получают пользователя из БД: вьюхи
+    вроде смены аватара и пароля сохраняют request.user целиком и
+    записали бы в БД устаревшие поля снимка.
+    """
+
+    def authenticate(self, request):
+        if not use_snapshot(request):
+            return super().authenticate(request)
+        key = self.get_key(request)
+        if key is None:
+            return None
+        cache_key = token_cache_key(key)
+        snapshot = local_cache.get(cache_key)
+        if snapshot is None:
+            snapshot = cache.get(cache_key)
+            if snapshot is None:
+                snapshot = self.load_snapshot(key)
+                cache.set(cache_key, snapshot, AUTH_TOKEN_CACHE_TIMEOUT)
+            local_cache.set(cache_key, snapshot)
+        return self.restore(key, snapshot)
+
+    async def aauthenticate(self, request):
+        """
+        Асинхронный вариант authenticate для асинхронных вьюх: при
+        попадании в LRU процесса обходится без потоков и запросов.
+        """
+        key = self.get_key(request)
+        if key is None:
+            return None
+        if not use_snapshot(request):
+            return await sync_to_async(self.authenticate_credentials)(key)
+        cache_key = token_cache_key(key)
+        snapshot = local_cache.get(cache_key)
+        if snapshot is None:
+            snapshot = await cache.aget(cache_key)
+            if snapshot is None:
+                snapshot = await sync_to_async(self.load_snapshot)(key)
+                await cache.aset(
+                    cache_key, snapshot, AUTH_TOKEN_CACHE_TIMEOUT)
+            local_cache.set(cache_key, snapshot)
+        return self.restore(key, snapshot)
+
+    def get_key(self, request):
+        """Токен из заголовка Authorization, как в TokenAuthentication."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. '
+                  'Token string should not contain spaces.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. '
+                  'Token string should not contain invalid characters.'))
+
+    def restore(self, key, snapshot):
+        """Собирает пользователя и токен из снимка без запросов к БД."""
+        user_values, created = snapshot
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, user_values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        token = self.get_model()(key=key, user=user, created=created)
+        token._state.adding = False
+        return user, token
+
+    def load_snapshot(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return (
+            tuple(getattr(token.user, field) for field in USER_FIELDS),
+            token.created,
+        )
@@ -0,0 +1,145 @@
+from bisect import bisect_left
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from recipes.constants import (
+    INGREDIENT_INDEX_VERSION_KEY, INGREDIENT_SEARCH_LIMIT,
+    INGREDIENT_TYPO_MAX_DISTANCE, INGREDIENT_TYPO_MIN_LENGTH)
+from recipes.models import Ingredient
+
+from .cache import incr_version
+
+
+def normalize(name):
+    """Приводит название к виду для сравнения без учета регистра и ё."""
+    return name.casefold().replace('ё', 'е').strip()
+
+
+def prefix_distance(query, name, max_distance):
+    """
+    Расстояние Левенштейна от query до ближайшего префикса name.
+
+    Считает только диагональную полосу шириной max_distance и
+    возвращает None, если расстояние ее превышает.
+    """
+    overflow = max_distance + 1
+    previous = [j if j <= max_distance else overflow
+                for j in range(len(name) + 1)]
+    for i, query_char in enumerate(query, 1):
+        current = [i if i <= max_distance else overflow]
+        current.extend([overflow] * len(name))
+        for j in range(max(1, i - max_distance),
+                       min(len(name), i + max_distance) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (query_char != name[j - 1]),
+                overflow,
+            )
+        if min(current) > max_distance:
+            return None
+        previous = current
+    distance = min(previous)
+    return distance if distance <= max_distance else None
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный по нормализованному названию массив,
+    префиксный поиск выполняется бинарным поиском. Если совпадений
+    по префиксу нет, ищет названия с опечатками: первая или вторая
+    буква запроса должна совпадать.
+    Индекс перестраивается, когда в общем кэше меняется версия.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = ([], [])
+
+    def build(self):
+        rows = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit')
+        )
+        self._entries = (
+            [row[0] for row in rows],
+            [{'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+             for _, pk, name, measurement_unit in rows],
+        )
+
+    def ensure_fresh(self):
+        self.refresh(cache.get(INGREDIENT_INDEX_VERSION_KEY, 0))
+
+    async def aensure_fresh(self):
+        """Асинхронный вариант: в поток уходит только перестройка."""
+        version = await cache.aget(INGREDIENT_INDEX_VERSION_KEY, 0)
+        if self._version != version:
+            await sync_to_async(self.refresh)(version)
+
+    def refresh(self, version):
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version != version:
+                self.build()
+                self._version = version
+
+    def all(self):
+        self.ensure_fresh()
+        return self._entries[1]
+
+    async def aall(self):
+        await self.aensure_fresh()
+        return self._entries[1]
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        self.ensure_fresh()
+        return self.find(query, limit)
+
+    async def asearch(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        await self.aensure_fresh()
+        return self.find(query, limit)
+
+    def find(self, query, limit):
+        keys, items = self._entries
+        query = normalize(query)
+        results = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(results) < limit
+               and keys[position].startswith(query)):
+            results.append(items[position])
+            position += 1
+        if not results and len(query) >= INGREDIENT_TYPO_MIN_LENGTH:
+            return self.search_typos(keys, items, query, limit)
+        return results
+
+    def search_typos(self, keys, items, query, limit):
+        max_distance = min(INGREDIENT_TYPO_MAX_DISTANCE, len(query) // 3)
+        candidates = []
+        distances = {}
+        for key, item in zip(keys, items):
+            if key[:1] != query[0] and key[1:2] != query[1]:
+                continue
+            prefix = key[:len(query) + max_distance]
+            if prefix not in distances:
+                distances[prefix] = prefix_distance(
+                    query, prefix, max_distance)
+            distance = distances[prefix]
+            if distance is not None:
+                candidates.append((distance, key, item))
+        candidates.sort(key=lambda candidate: candidate[:2])
+        return [item for _, _, item in candidates[:limit]]
+
+
+def invalidate_ingredient_index():
+    """Помечает индексы всех процессов устаревшими."""
+    incr_version(INGREDIENT_INDEX_VERSION_KEY)
+
+
+ingredient_index = IngredientIndex()
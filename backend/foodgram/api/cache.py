@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time_ns
+
+from asgiref.sync import sync_to_async
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from recipes.constants import (
+    RECIPE_FRAGMENT_TIMEOUT, REFERENCE_CACHE_TIMEOUT, REFERENCE_LRU_SIZE)
+
+FRAGMENT_KEY = 'recipe-fragment:2:{pk}:{generation}:{version}:{updated_at}'
+VERSION_KEY = 'recipe-fragment-version:{pk}'
+GENERATION_KEY = 'recipe-fragment-generation'
+TAGS_VERSION_KEY = 'tags-version'
+REFERENCE_KEY = 'reference-response:{version_key}:{version}:{path}'
+
+
+def is_shared_cache():
+    """
+    Видят ли все процессы одни и те же записи кэша.
+
+    Счетчики версий и снимки токенов инвалидируются записью в кэш;
+    с LocMemCache она доходит только до процесса, который ее сделал.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def initial_version():
+    """
+    Начальное значение счетчика, если его нет в кэше.
+
+    Берется от времени, а не с нуля: после сброса кэша версии не
+    повторяются, и выданные ранее ETag не совпадут с новыми.
+    """
+    return time_ns() // 1000
+
+
+def incr_version(key):
+    """Увеличивает счетчик версии в общем кэше."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = initial_version()
+        cache.set(key, version, None)
+        return version
+
+
+def get_versions(*keys):
+    """Возвращает значения счетчиков, заводя недостающие."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(*keys):
+    """Асинхронный вариант get_versions."""
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, initial_version(), None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def bump_recipe_version(recipe_id):
+    """Инвалидирует закэшированный фрагмент одного рецепта."""
+    bump_recipe_versions([recipe_id])
+
+
+def bump_recipe_versions(recipe_ids):
+    """Инвалидирует фрагменты нескольких рецептов."""
+    for recipe_id in recipe_ids:
+        incr_version(VERSION_KEY.format(pk=recipe_id))
+
+
+def bump_fragment_generation():
+    """Инвалидирует фрагменты всех рецептов разом."""
+    incr_version(GENERATION_KEY)
+
+
+def bump_tags_version():
+    incr_version(TAGS_VERSION_KEY)
+
+
+def fragment_version_keys(recipes):
+    return [GENERATION_KEY, *(
+        VERSION_KEY.format(pk=recipe.pk) for recipe in recipes)]
+
+
+def fragment_keys(recipes, versions):
+    """Ключи фрагментов по версиям, полученным из кэша."""
+    generation = versions.get(GENERATION_KEY, 0)
+    return {
+        recipe.pk: FRAGMENT_KEY.format(
+            pk=recipe.pk,
+            generation=generation,
+            version=versions.get(VERSION_KEY.format(pk=recipe.pk), 0),
+            updated_at=recipe.updated_at.timestamp(),
+        )
+        for recipe in recipes
+    }
+
+
+def get_recipe_fragments(recipes, build_many):
+    """
+    Возвращает словарь {pk: фрагмент} для переданных рецептов.
+
+    Недостающие в кэше фрагменты строятся одним вызовом
+    build_many(recipes) и сохраняются одним запросом; для рецептов из
+    кэша к БД не обращаемся.
+    """
+    keys = fragment_keys(
+        recipes, cache.get_many(fragment_version_keys(recipes)))
+    cached = cache.get_many(keys.values())
+    fragments = {
+        recipe.pk: cached[keys[recipe.pk]]
+        for recipe in recipes if keys[recipe.pk] in cached
+    }
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    if missing:
+        built = build_many(missing)
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            RECIPE_FRAGMENT_TIMEOUT
+        )
+        fragments.update(built)
+    return fragments
+
+
+async def aget_recipe_fragments(recipes, build_many):
+    """
+    Асинхронный вариант get_recipe_fragments.
+
+    Недостающие фрагменты строятся одним вызовом build_many(recipes)
+    в потоке: сериализатору нужны синхронные запросы к БД.
+    """
+    keys = fragment_keys(
+        recipes, await cache.aget_many(fragment_version_keys(recipes)))
+    cached = await cache.aget_many(keys.values())
+    fragments = {
+        recipe.pk: cached[keys[recipe.pk]]
+        for recipe in recipes if keys[recipe.pk] in cached
+    }
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    if missing:
+        built = await sync_to_async(build_many)(missing)
+        await cache.aset_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            RECIPE_FRAGMENT_TIMEOUT
+        )
+        fragments.update(built)
+    return fragments
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш процесса.
+
+    Записи живут не дольше timeout секунд: инвалидация из других
+    процессов сюда не доходит, поэтому устаревшее значение держится
+    недолго.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+reference_cache = LRUCache(REFERENCE_LRU_SIZE, REFERENCE_CACHE_TIMEOUT)
+
+
+def get_rendered_response(key):
+    """Ищет готовые байты ответа в LRU процесса, затем в общем кэше."""
+    content = reference_cache.get(key)
+    if content is None:
+        content = cache.get(key)
+        if content is not None:
+            reference_cache.set(key, content)
+    return content
+
+
+def set_rendered_response(key, content):
+    reference_cache.set(key, content)
+    cache.set(key, content, REFERENCE_CACHE_TIMEOUT)
+
+
+async def aget_rendered_response(key):
+    content = reference_cache.get(key)
+    if content is None:
+        content = await cache.aget(key)
+        if content is not None:
+            reference_cache.set(key, content)
+    return content
+
+
+async def aset_rendered_response(key, content):
+    reference_cache.set(key, content)
+    await cache.aset(key, content, REFERENCE_CACHE_TIMEOUT)
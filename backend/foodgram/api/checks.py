@@ -0,0 +1,33 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from .cache import is_shared_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии фрагментов и справочников должны жить в общем кэше."""
+    if is_shared_cache():
+        return []
+    return [Warning(
+        'The default cache is local to each process: cache invalidation '
+        'will not reach other workers.',
+        hint='Set REDIS_URL to use the shared Redis cache.',
+        id='api.W001',
+    )]
+
+
+@register()
+def check_pdf_font(app_configs, **kwargs):
+    """Без шрифта с кириллицей PDF-список покупок не построить."""
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if os.path.isfile(font_path):
+        return []
+    return [Error(
+        f'SHOPPING_LIST_PDF_FONT: font file {font_path} not found.',
+        hint='Point SHOPPING_LIST_PDF_FONT to a TrueType font with '
+             'Cyrillic glyphs.',
+        id='api.E002',
+    )]
@@ -0,0 +1,55 @@
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Собирает ETag из значений, от которых зависит ответ."""
+    digest = md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def set_validators(response, etag, last_modified=None,
+                   vary=('Authorization',)):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
+
+
+def conditional_response(request, etag, last_modified, get_response,
+                         vary=('Authorization',)):
+    """
+    Отвечает 304 Not Modified, если у клиента актуальная версия, иначе
+    вызывает get_response. Сериализация при совпадении не выполняется.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            int(last_modified.timestamp()) if last_modified else None),
+    )
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 304):
+        set_validators(response, etag, last_modified, vary)
+    return response
+
+
+async def aconditional_response(request, etag, last_modified, get_response,
+                                vary=('Authorization',)):
+    """Асинхронный вариант conditional_response: get_response — корутина."""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            int(last_modified.timestamp()) if last_modified else None),
+    )
+    if response is None:
+        response = await get_response()
+    if response.status_code in (200, 304):
+        set_validators(response, etag, last_modified, vary)
+    return response
@@ -0,0 +1,72 @@
+from django.core.files.storage import default_storage
+from rest_framework.fields import Field, IntegerField, ListField
+
+from recipes.constants import IMAGE_FORMATS, IMAGE_SIZE_PARAM, IMAGE_SIZES
+
+
+class ImageVariantsField(Field):
+    """
+    Отдает URL уменьшенных копий изображения в виде
+    {размер: {формат: url}}; еще не готовые копии пропускаются.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, derivatives):
+        variants = {}
+        for size in IMAGE_SIZES:
+            for extension in IMAGE_FORMATS:
+                name = derivatives.get(f'{size}.{extension}')
+                if name:
+                    variants.setdefault(size, {})[extension] = (
+                        default_storage.url(name))
+        return absolute_variants(variants, self.context.get('request'))
+
+
+class PrimaryKeyListField(ListField):
+    """
+    Список первичных ключей, который проверяется одним запросом id__in,
+    а не запросом на каждый элемент, как PrimaryKeyRelatedField(many=True).
+    """
+
+    default_error_messages = {
+        'does_not_exist':
+            'Недопустимый первичный ключ "{pk_value}" - объект не существует.',
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(child=IntegerField(), **kwargs)
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                self.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+    def to_representation(self, data):
+        return [obj.pk for obj in data.all()]
+
+
+def absolute_variants(variants, request):
+    if request is None:
+        return variants
+    return {
+        size: {
+            extension: request.build_absolute_uri(url)
+            for extension, url in urls.items()
+        }
+        for size, urls in variants.items()
+    }
+
+
+def pick_image(image, variants, request):
+    """Подменяет оригинал копией размера из ?image_size, если она готова."""
+    if request is None:
+        return image
+    size = request.query_params.get(IMAGE_SIZE_PARAM)
+    return variants.get(size, {}).get('webp', image)
@@ -1,10 +1,35 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
+from recipes.constants import SEARCH_MAX_LENGTH
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
+TAGS_MATCH_CHOICES = (
+    (TAGS_MATCH_ANY, 'Любой из тегов'),
+    (TAGS_MATCH_ALL, 'Все теги'),
+)
+
+
+def has_tags(tag_ids):
+    """EXISTS по таблице связей рецептов и тегов без JOIN в основной
+    запрос, поэтому строки рецептов не размножаются."""
+    return Exists(Recipe.tags.through.objects.filter(
+        recipe_id=OuterRef('pk'), tag_id__in=tag_ids))
+
+
+def filter_by_tags(queryset, tag_ids, match=TAGS_MATCH_ANY):
+    if match == TAGS_MATCH_ALL:
+        for tag_id in tag_ids:
+            queryset = queryset.filter(has_tags([tag_id]))
+        return queryset
+    return queryset.filter(has_tags(tag_ids))
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='startswith')
@@ -19,16 +44,36 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES,
+        method='filter_tags_match',
     )
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(
+        method='filter_search', max_length=SEARCH_MAX_LENGTH)
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return filter_by_tags(
+            queryset,
+            [tag.pk for tag in value],
+            self.form.cleaned_data.get('tags_match') or TAGS_MATCH_ANY
+        )
+
+    def filter_tags_match(self, queryset, name, value):
+        """Режим применяется в filter_tags."""
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
@@ -40,3 +85,9 @@ class RecipeFilter(FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(shopping_cart__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
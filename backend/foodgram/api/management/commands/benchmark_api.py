@@ -0,0 +1,265 @@
+import json
+import os
+import tracemalloc
+from base64 import b64encode
+from io import BytesIO
+from math import ceil
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext, setup_test_environment, teardown_test_environment)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.autocomplete import invalidate_ingredient_index
+from api.cache import reference_cache
+from api.shortlinks import local_cache
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.seeding import DatasetGenerator
+from recipes.shortlinks import encode_short_link
+from users.models import User
+
+SIZES = (200, 2000)
+PERCENTILES = (50, 95, 99)
+LATENCY_SLACK_MS = 1
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    return values[max(ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def image_base64():
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), (200, 120, 40)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+def read_response(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark core API endpoints on generated datasets in a test '
+        'database and compare with a stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=SIZES,
+            help='Numbers of recipes in the generated datasets.')
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmark_baseline.json'))
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Store this run as the new baseline.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Allowed relative growth of median latency and peak memory.')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with TemporaryDirectory() as media_root, override_settings(
+                CACHES=BENCHMARK_CACHES,
+                MEDIA_ROOT=media_root,
+                IMAGE_DERIVATIVES_ASYNC=False,
+            ):
+                results = {
+                    str(size): self.run_size(size, options)
+                    for size in options['sizes']
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if options['save_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Baseline saved to {options["baseline"]}.'))
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(self.style.WARNING(
+                'No baseline found, run with --save-baseline to store one.'))
+            return
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = list(
+            self.compare(results, baseline, options['tolerance']))
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} regressions against the baseline.')
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    def prepare(self, size, seed):
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        reference_cache.clear()
+        local_cache.clear()
+        invalidate_ingredient_index()
+        DatasetGenerator(seed=seed).generate(
+            users=max(size // 10, 10), recipes=size)
+        return User.objects.annotate(
+            carts=Count('shopping_cart', distinct=True),
+            subscriptions=Count('subscriber', distinct=True),
+        ).order_by('-carts', '-subscriptions', 'pk').first()
+
+    def scenarios(self, client):
+        recipe = Recipe.objects.order_by('-created_at', 'id').first()
+        tag = Tag.objects.order_by('pk').first()
+        ingredients = list(
+            Ingredient.objects.order_by('pk')[:5].values_list('pk', 'name'))
+        payload = {
+            'name': 'Новый рецепт',
+            'text': 'Описание.',
+            'cooking_time': 15,
+            'tags': [tag.pk],
+            'image': image_base64(),
+            'ingredients': [
+                {'id': pk, 'amount': 10} for pk, _ in ingredients],
+        }
+        own_recipe_id = client.post(
+            '/api/recipes/', data=json.dumps(payload),
+            content_type='application/json'
+        ).json()['id']
+        updates = iter(range(1, 10 ** 9))
+
+        def update_payload():
+            amount = next(updates) % 100 + 1
+            return {
+                'tags': [tag.pk],
+                'ingredients': [
+                    {'id': pk, 'amount': amount} for pk, _ in ingredients],
+            }
+
+        return (
+            ('recipes list, anonymous', False, 'get', '/api/recipes/', None),
+            ('recipes list', True, 'get', '/api/recipes/', None),
+            ('recipes list by tag', True, 'get',
+             f'/api/recipes/?tags={tag.slug}', None),
+            ('recipes list, favorited', True, 'get',
+             '/api/recipes/?is_favorited=1', None),
+            ('recipe detail', True, 'get', f'/api/recipes/{recipe.pk}/', None),
+            ('recipe create', True, 'post', '/api/recipes/',
+             lambda: payload),
+            ('recipe update', True, 'patch',
+             f'/api/recipes/{own_recipe_id}/', update_payload),
+            ('subscriptions', True, 'get', '/api/users/subscriptions/', None),
+            ('download shopping cart', True, 'get',
+             '/api/recipes/download_shopping_cart/', None),
+            ('ingredient autocomplete', False, 'get',
+             f'/api/ingredients/?name={ingredients[0][1][:3]}', None),
+            ('short link redirect', False, 'get',
+             f'/s/{encode_short_link(recipe.pk)}/', None),
+        )
+
+    def run_size(self, size, options):
+        token = Token.objects.create(
+            user=self.prepare(size, options['seed']))
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+        }
+        self.stdout.write(
+            f'{Recipe.objects.count()} recipes, {User.objects.count()} users')
+        results = {}
+        for name, authenticated, method, url, payload in self.scenarios(
+                clients[True]):
+            client = clients[authenticated]
+
+            def request():
+                kwargs = {}
+                if payload is not None:
+                    kwargs = {
+                        'data': json.dumps(payload()),
+                        'content_type': 'application/json',
+                    }
+                response = getattr(client, method)(url, **kwargs)
+                read_response(response)
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name}: {method.upper()} {url} returned '
+                        f'{response.status_code}.')
+
+            results[name] = self.measure(request, options)
+        return results
+
+    def measure(self, request, options):
+        for _ in range(options['warmup']):
+            request()
+        with CaptureQueriesContext(connection) as queries:
+            request()
+        query_count = len(queries)
+        tracemalloc.start()
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        latencies = []
+        for _ in range(options['requests']):
+            start = perf_counter()
+            request()
+            latencies.append((perf_counter() - start) * 1000)
+        latencies.sort()
+        result = {
+            f'p{percent}': round(percentile(latencies, percent), 3)
+            for percent in PERCENTILES
+        }
+        result['queries'] = query_count
+        result['peak_kib'] = round(peak / 1024, 1)
+        return result
+
+    def report(self, results):
+        for size, scenarios in results.items():
+            self.stdout.write(
+                f'\n{size} recipes\n{"scenario":<28}{"p50, ms":>10}'
+                f'{"p95, ms":>10}{"p99, ms":>10}{"queries":>9}'
+                f'{"peak, KiB":>11}'
+            )
+            for name, result in scenarios.items():
+                self.stdout.write(
+                    f'{name:<28}{result["p50"]:>10.2f}{result["p95"]:>10.2f}'
+                    f'{result["p99"]:>10.2f}{result["queries"]:>9}'
+                    f'{result["peak_kib"]:>11.1f}'
+                )
+
+    def compare(self, results, baseline, tolerance):
+        for size, scenarios in results.items():
+            for name, result in scenarios.items():
+                base = baseline.get(size, {}).get(name)
+                if base is None:
+                    continue
+                if result['queries'] > base['queries']:
+                    yield (
+                        f'{size}/{name}: {result["queries"]} queries, '
+                        f'baseline {base["queries"]}')
+                for key, slack in (('p50', LATENCY_SLACK_MS), ('peak_kib', 0)):
+                    if result[key] > base[key] * (1 + tolerance) + slack:
+                        yield (
+                            f'{size}/{name}: {key} {result[key]}, '
+                            f'baseline {base[key]}')
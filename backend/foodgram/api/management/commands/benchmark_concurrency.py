@@ -0,0 +1,140 @@
+import asyncio
+from math import ceil
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    return values[max(ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency of regular requests to a running server while '
+        'slow clients keep connections open'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path for regular requests; may be repeated.')
+        parser.add_argument(
+            '--slow-clients', type=int, default=50,
+            help='Connections that send their request one header at a '
+                 'time until the measurement ends.')
+        parser.add_argument(
+            '--slow-interval', type=float, default=0.5,
+            help='Seconds between headers sent by a slow client.')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--timeout', type=float, default=10)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only http:// URLs are supported.')
+        self.host = url.hostname
+        self.port = url.port or 80
+        paths = options['paths'] or ['/api/tags/', '/api/recipes/']
+        latencies, errors, elapsed = asyncio.run(self.run(paths, options))
+        self.stdout.write(
+            f'{options["slow_clients"]} slow clients, '
+            f'{options["requests"]} requests in {elapsed:.1f} s, '
+            f'{len(errors)} failed'
+        )
+        if latencies:
+            latencies.sort()
+            self.stdout.write(', '.join(
+                f'p{percent} {percentile(latencies, percent):.1f} ms'
+                for percent in PERCENTILES
+            ))
+        for error in sorted(set(errors)):
+            self.stdout.write(self.style.ERROR(
+                f'{errors.count(error)} x {error}'))
+
+    def request_head(self, path):
+        return (
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+            'Accept: application/json\r\nConnection: close\r\n'
+        ).encode()
+
+    async def run(self, paths, options):
+        stop = asyncio.Event()
+        slow = [
+            asyncio.create_task(self.slow_client(
+                paths[number % len(paths)], options['slow_interval'], stop))
+            for number in range(options['slow_clients'])
+        ]
+        # Медленные клиенты должны успеть занять соединения.
+        await asyncio.sleep(options['slow_interval'] * 2)
+        queue = asyncio.Queue()
+        for number in range(options['requests']):
+            queue.put_nowait(paths[number % len(paths)])
+        latencies = []
+        errors = []
+        start = perf_counter()
+        await asyncio.gather(*(
+            self.regular_client(queue, options['timeout'], latencies, errors)
+            for _ in range(options['concurrency'])
+        ))
+        elapsed = perf_counter() - start
+        stop.set()
+        await asyncio.gather(*slow, return_exceptions=True)
+        return latencies, errors, elapsed
+
+    async def regular_client(self, queue, timeout, latencies, errors):
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = perf_counter()
+            try:
+                status = await asyncio.wait_for(self.fetch(path), timeout)
+            except asyncio.TimeoutError:
+                errors.append('timeout')
+                continue
+            except OSError as error:
+                errors.append(type(error).__name__)
+                continue
+            if status != 200:
+                errors.append(f'HTTP {status}')
+                continue
+            latencies.append((perf_counter() - start) * 1000)
+
+    async def fetch(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(self.request_head(path) + b'\r\n')
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+        return int(status_line.split()[1])
+
+    async def slow_client(self, path, interval, stop):
+        """
+        Держит соединение, как клиент на плохой сети: пока идет замер,
+        досылает по заголовку раз в interval секунд.
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(self.request_head(path))
+            await writer.drain()
+            number = 0
+            while not stop.is_set():
+                writer.write(f'X-Slow-{number}: 1\r\n'.encode())
+                await writer.drain()
+                number += 1
+                try:
+                    await asyncio.wait_for(stop.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+            writer.write(b'\r\n')
+            await writer.drain()
+            await reader.read()
+        finally:
+            writer.close()
@@ -0,0 +1,46 @@
+from timeit import repeat
+
+from django.core.management.base import BaseCommand
+
+from api.autocomplete import ingredient_index
+from api.filters import IngredientFilter
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+DEFAULT_QUERIES = ('а', 'мол', 'картоф', 'сахар', 'кортофель')
+
+
+class Command(BaseCommand):
+    help = 'Compare ingredient autocomplete index with IngredientFilter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--number', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, func, options):
+        timings = repeat(func, number=options['number'],
+                         repeat=options['repeat'])
+        return min(timings) / options['number'] * 1000
+
+    def handle(self, *args, **options):
+        ingredient_index.ensure_fresh()
+        self.stdout.write(
+            f'{"query":<15}{"filter, ms":>12}{"index, ms":>12}'
+            f'{"speedup":>10}{"found":>8}'
+        )
+        for query in options['queries']:
+            def run_filter():
+                queryset = IngredientFilter(
+                    {'name': query}, queryset=Ingredient.objects.all()).qs
+                return IngredientSerializer(queryset, many=True).data
+
+            filter_ms = self.measure(run_filter, options)
+            index_ms = self.measure(
+                lambda: ingredient_index.search(query), options)
+            self.stdout.write(
+                f'{query:<15}{filter_ms:>12.3f}{index_ms:>12.3f}'
+                f'{filter_ms / index_ms:>9.1f}x'
+                f'{len(ingredient_index.search(query)):>8}'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
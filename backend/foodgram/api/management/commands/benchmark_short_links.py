@@ -0,0 +1,74 @@
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.test import RequestFactory
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+
+from api.shortlinks import SHORT_LINK_KEY, local_cache
+from api.views import redirect_short_link
+from recipes.models import Recipe, ShortLink
+from recipes.shortlinks import decode_short_link, encode_short_link
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def drf_redirect_short_link(request, short_link):
+    """Прежняя реализация: стек DRF и запрос в БД на каждый переход."""
+    recipe_id = decode_short_link(short_link)
+    if recipe_id is None:
+        recipe_id = get_object_or_404(
+            ShortLink, short_link=short_link).recipe_id
+    elif not Recipe.objects.filter(pk=recipe_id).exists():
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
+
+
+class Command(BaseCommand):
+    help = 'Compare short link redirect throughput with the old DRF view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--codes', type=int, default=100)
+
+    def measure(self, view, codes, total):
+        factory = RequestFactory()
+        requests = [
+            (factory.get(f'/s/{code}/'), code) for code in codes]
+        start = perf_counter()
+        for number in range(total):
+            request, code = requests[number % len(requests)]
+            view(request, short_link=code)
+        return total / (perf_counter() - start)
+
+    def clear_caches(self, codes):
+        local_cache.clear()
+        cache.delete_many([SHORT_LINK_KEY.format(code=code) for code in codes])
+
+    def handle(self, *args, **options):
+        codes = [
+            encode_short_link(pk) for pk in Recipe.objects.order_by(
+                '-pk').values_list('pk', flat=True)[:options['codes']]
+        ]
+        if not codes:
+            raise CommandError('No recipes to link to.')
+        total = options['requests']
+        before = self.measure(drf_redirect_short_link, codes, total)
+        self.clear_caches(codes)
+        cold = self.measure(redirect_short_link, codes, len(codes))
+        warm = self.measure(redirect_short_link, codes, total)
+        local_cache.clear()
+        shared = self.measure(redirect_short_link, codes, len(codes))
+        self.stdout.write(f'{"view":<30}{"req/s":>12}')
+        for name, rate in (
+            ('DRF view + DB', before),
+            ('plain view, cold caches', cold),
+            ('plain view, shared cache', shared),
+            ('plain view, LRU hit', warm),
+        ):
+            self.stdout.write(f'{name:<30}{rate:>12.0f}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Speedup on LRU hits: {warm / before:.1f}x.'))
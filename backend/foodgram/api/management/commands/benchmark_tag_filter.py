@@ -0,0 +1,65 @@
+from timeit import repeat
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.filters import TAGS_MATCH_ALL, TAGS_MATCH_ANY, filter_by_tags
+from recipes.constants import PAGE_PAGINATION
+from recipes.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = 'Compare JOIN + DISTINCT tag filtering with EXISTS semi-joins'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*')
+        parser.add_argument('--number', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def measure(self, queryset, options):
+        def run():
+            queryset.count()
+            list(queryset.values_list('pk', flat=True)[:PAGE_PAGINATION])
+
+        timings = repeat(run, number=options['number'],
+                         repeat=options['repeat'])
+        return min(timings) / options['number'] * 1000
+
+    def handle(self, *args, **options):
+        tags = Tag.objects.all()
+        if options['slugs']:
+            tags = tags.filter(slug__in=options['slugs'])
+        tags = list(tags[:3])
+        if len(tags) < 2:
+            raise CommandError('At least two tags are needed.')
+        slugs = [tag.slug for tag in tags]
+        tag_ids = [tag.pk for tag in tags]
+        recipes = Recipe.objects.order_by('-created_at', 'id')
+
+        joined = recipes.filter(tags__slug__in=slugs)
+        ids = list(joined.values_list('pk', flat=True))
+        self.stdout.write(
+            f'{Recipe.objects.count()} recipes, tags {", ".join(slugs)}: '
+            f'JOIN without DISTINCT returns {len(ids)} rows '
+            f'for {len(set(ids))} recipes.'
+        )
+        all_joined = recipes
+        for slug in slugs:
+            all_joined = all_joined.filter(tags__slug=slug)
+        cases = (
+            ('any', joined.distinct(),
+             filter_by_tags(recipes, tag_ids, TAGS_MATCH_ANY)),
+            ('all', all_joined.distinct(),
+             filter_by_tags(recipes, tag_ids, TAGS_MATCH_ALL)),
+        )
+        self.stdout.write(
+            f'{"match":<8}{"JOIN, ms":>12}{"EXISTS, ms":>12}'
+            f'{"speedup":>10}{"found":>8}'
+        )
+        for name, old, new in cases:
+            old_ms = self.measure(old, options)
+            new_ms = self.measure(new, options)
+            self.stdout.write(
+                f'{name:<8}{old_ms:>12.3f}{new_ms:>12.3f}'
+                f'{old_ms / new_ms:>9.1f}x{new.count():>8}'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
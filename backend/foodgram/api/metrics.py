@@ -0,0 +1,190 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess)
+
+from recipes.constants import (
+    METRICS_DURATION_BUCKETS, METRICS_METHODS, METRICS_PREFIX,
+    METRICS_QUERY_BUCKETS)
+
+current_timings = ContextVar('current_timings', default=None)
+recording = ContextVar('metrics_recording', default=True)
+
+# Каталог, где воркеры gunicorn пишут значения метрик в общие файлы
+# (режим multiprocess prometheus_client); задается в gunicorn.conf.py.
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+
+class RequestTimings:
+    """Замеры одного запроса."""
+
+    __slots__ = (
+        'route', 'db_queries', 'db_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.route = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.2f};'
+            f'desc="{self.db_queries} queries"',
+            f'serializer;dur={self.serializer_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ))
+
+
+METRICS = (
+    ('request_duration_seconds', 'Полное время обработки запроса.',
+     METRICS_DURATION_BUCKETS),
+    ('db_duration_seconds', 'Время SQL-запросов за запрос.',
+     METRICS_DURATION_BUCKETS),
+    ('db_queries', 'Количество SQL-запросов за запрос.',
+     METRICS_QUERY_BUCKETS),
+    ('serializer_duration_seconds', 'Время сериализации ответа.',
+     METRICS_DURATION_BUCKETS),
+)
+
+
+class MetricsRegistry:
+    """
+    Гистограммы по маршрутам и счетчик ответов.
+
+    Под gunicorn каждый воркер пишет значения в файлы каталога
+    PROMETHEUS_MULTIPROC_DIR, и /metrics отдает сумму по всем воркерам,
+    в том числе завершившимся, так что счетчики не убывают. Без этого
+    каталога (runserver, один процесс) у рядов есть метка worker с pid,
+    чтобы ряды разных процессов не смешивались.
+    """
+
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        self.worker_labels = () if MULTIPROCESS else ('worker',)
+        self.histograms = [
+            Histogram(
+                f'{METRICS_PREFIX}_{name}', description,
+                ('route', *self.worker_labels), buckets=buckets,
+                registry=None if MULTIPROCESS else self.registry)
+            for name, description, buckets in METRICS
+        ]
+        self.responses = Counter(
+            f'{METRICS_PREFIX}_responses', 'Количество ответов по статусам.',
+            ('route', 'method', 'status', *self.worker_labels),
+            registry=None if MULTIPROCESS else self.registry)
+        if MULTIPROCESS:
+            multiprocess.MultiProcessCollector(self.registry)
+
+    def worker(self):
+        return (str(os.getpid()),) if self.worker_labels else ()
+
+    def observe(self, route, method, status, timings, total):
+        if not recording.get():
+            return
+        # Метод приходит от клиента: произвольные значения не должны
+        # плодить ряды метрик.
+        if method not in METRICS_METHODS:
+            method = 'other'
+        worker = self.worker()
+        values = (
+            total, timings.db_time, timings.db_queries,
+            timings.serializer_time)
+        for histogram, value in zip(self.histograms, values):
+            histogram.labels(route, *worker).observe(value)
+        self.responses.labels(route, method, status, *worker).inc()
+
+    @contextmanager
+    def paused(self):
+        """Запросы внутри блока (прогрев) в метрики не попадают."""
+        token = recording.set(False)
+        try:
+            yield
+        finally:
+            recording.reset(token)
+
+    def clear(self):
+        for metric in (*self.histograms, self.responses):
+            metric.clear()
+
+    def render(self):
+        """Отдает метрики в текстовом формате Prometheus."""
+        return generate_latest(self.registry)
+
+
+registry = MetricsRegistry()
+
+
+def route_name(view_func, method):
+    """
+    Имя маршрута для меток: класс и действие для вьюсетов DRF
+    (RecipeViewSet.list), имя функции для остальных вьюх.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None)
+    if not actions:
+        return view_class.__name__
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL для замеров текущего запроса.
+
+    Запрос берется из contextvar, поэтому замер работает и в потоках
+    sync_to_async асинхронных вьюх; вне запроса обертка ничего не
+    делает, кроме одного чтения contextvar.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += perf_counter() - start
+        timings.db_queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Обработчик connection_created: одна обертка на соединение."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Добавляет время блока к замеру сериализации текущего запроса.
+
+    Вложенные блоки не считаются повторно.
+    """
+    timings = current_timings.get()
+    if timings is None or timings.serializing:
+        yield
+        return
+    timings.serializing = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.serializer_time += perf_counter() - start
+        timings.serializing = False
+
+
+class TimedRepresentationMixin:
+    """
+    Примесь к сериализаторам ответов: время to_representation идет
+    в замер сериализации запроса. Вложенные сериализаторы и элементы
+    списка внутри замера не считаются повторно.
+    """
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
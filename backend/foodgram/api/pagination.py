@@ -1,8 +1,104 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from recipes.constants import PAGE_PAGINATION
 
+POSITION_SEPARATOR = ','
+
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = PAGE_PAGINATION
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация рецептов без COUNT(*) и OFFSET.
+
+    CursorPagination из DRF запоминает в курсоре только первое поле
+    сортировки, а строки с одинаковым значением пропускает через OFFSET.
+    Здесь позиция — значения всех полей сортировки, (created_at, id), и
+    страница выбирается условием по ним обоим, так что запрос идет по
+    индексу recipe_created_at_id_idx с любой глубины.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = PAGE_PAGINATION
+    ordering = ('-created_at', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        queryset = queryset.order_by(*(
+            reverse_order(field) if reverse else field
+            for field in self.ordering
+        ))
+        if current_position is not None:
+            queryset = queryset.filter(
+                self.after_position(queryset.model, current_position, reverse))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering)
+        else:
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def after_position(self, model, position, reverse):
+        """
+        Условие «строка идет после position» в порядке self.ordering:
+        created_at < c OR (created_at = c AND id > i) для прямого курсора.
+        """
+        values = position.split(POSITION_SEPARATOR)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        return POSITION_SEPARATOR.join(
+            str(getattr(instance, field.lstrip('-'))) for field in ordering)
+
+
+def reverse_order(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
@@ -1,31 +1,39 @@
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import (
-    CharField, IntegerField, SerializerMethodField)
+    CharField, IntegerField, ListField, SerializerMethodField)
 from rest_framework.relations import PrimaryKeyRelatedField
-from rest_framework.serializers import BooleanField, ModelSerializer
+from rest_framework.serializers import (
+    BooleanField, ListSerializer, ModelSerializer, Serializer)
 
-from recipes.constants import MAX_LENGTH_NAME_RECIPE
+from recipes.constants import MAX_LENGTH_NAME_RECIPE, RECIPE_BATCH_LIMIT
 from recipes.models import Ingredient, Recipe, RecipeIngredient, ShortLink, Tag
+from recipes.shopping_cart import apply_recipe_deltas
 from users.models import Subscribe, User
 
+from .cache import get_recipe_fragments
+from .fields import (
+    ImageVariantsField, PrimaryKeyListField, absolute_variants, pick_image)
+from .metrics import TimedRepresentationMixin, timed_serialization
 
-class TagSerializer(ModelSerializer):
+
+class TagSerializer(TimedRepresentationMixin, ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedRepresentationMixin, ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
-class AvatarSerializer(UserSerializer):
+class AvatarSerializer(TimedRepresentationMixin, UserSerializer):
     avatar = Base64ImageField()
 
     class Meta:
@@ -40,16 +48,19 @@ class UserSignUpSerializer(UserCreateSerializer):
                   'last_name', 'password')
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedRepresentationMixin, UserSerializer):
     is_subscribed = SerializerMethodField(read_only=True)
     avatar = Base64ImageField(required=False)
+    avatar_variants = ImageVariantsField(source='avatar_derivatives')
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'avatar')
+                  'last_name', 'is_subscribed', 'avatar', 'avatar_variants')
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
@@ -75,14 +86,19 @@ class SubscribeSerializer(CustomUserSerializer):
         return data
 
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return author.recipes.count()
 
     def get_recipes(self, author):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = author.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(author, 'limited_recipes'):
+            recipes = author.limited_recipes
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = author.recipes.all()
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
@@ -112,6 +128,51 @@ class RecipeIngredientCreateSerializer(ModelSerializer):
         fields = ('id', 'amount')
 
 
+class AuthorFragmentSerializer(ModelSerializer):
+    """Сериализатор автора без данных о подписке текущего пользователя."""
+
+    avatar = Base64ImageField(required=False)
+    avatar_variants = ImageVariantsField(source='avatar_derivatives')
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name',
+                  'last_name', 'avatar', 'avatar_variants')
+
+
+class RecipeFragmentSerializer(ModelSerializer):
+    """Не зависящая от пользователя часть рецепта, которая кэшируется."""
+
+    author = AuthorFragmentSerializer(read_only=True)
+    tags = TagSerializer(many=True, read_only=True)
+    ingredients = RecipeIngredientsSerializer(
+        many=True,
+        source='recipeingredients',
+        read_only=True
+    )
+    image = Base64ImageField(read_only=True)
+    image_variants = ImageVariantsField(source='image_derivatives')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients', 'name',
+                  'image', 'image_variants', 'text', 'cooking_time')
+
+
+class RecipeListSerializer(ListSerializer):
+    """Достает фрагменты всей страницы рецептов одним запросом к кэшу."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        with timed_serialization():
+            fragments = get_recipe_fragments(
+                recipes, self.child.build_fragments)
+            return [
+                self.child.merge_user_data(recipe, fragments[recipe.pk])
+                for recipe in recipes
+            ]
+
+
 class RecipeGetSerializer(ModelSerializer):
     """Сериализатор для получения рецепта."""
 
@@ -125,14 +186,89 @@ class RecipeGetSerializer(ModelSerializer):
     is_favorited = BooleanField(default=False)
     is_in_shopping_cart = BooleanField(default=False)
     image = Base64ImageField(required=True)
+    image_variants = ImageVariantsField(source='image_derivatives')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time', 'favorites_count', 'in_carts_count'
         )
-        read_only_fields = ('author', 'tags', 'ingredients')
+        read_only_fields = ('author', 'tags', 'ingredients',
+                            'favorites_count', 'in_carts_count')
+        list_serializer_class = RecipeListSerializer
+
+    def build_fragment(self, recipe):
+        """Сериализует рецепт без request, т.е. с относительными URL."""
+        return RecipeFragmentSerializer(recipe).data
+
+    def build_fragments(self, recipes):
+        """
+        Фрагменты рецептов, которых нет в кэше. Рецепты из облегченного
+        запроса страницы (с отложенными полями) перечитываются целиком
+        одним запросом; теги и ингредиенты подгружаются для всех сразу.
+        """
+        if any(recipe.get_deferred_fields() - {'search_vector'}
+               for recipe in recipes):
+            recipes = list(Recipe.objects.select_related('author').defer(
+                'search_vector').filter(
+                    pk__in=[recipe.pk for recipe in recipes]))
+        prefetch_related_objects(
+            recipes,
+            'author',
+            'tags',
+            Prefetch(
+                'recipeingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')
+            ),
+        )
+        return {recipe.pk: self.build_fragment(recipe) for recipe in recipes}
+
+    def merge_user_data(self, recipe, fragment):
+        """
+        Дополняет кэшированный фрагмент данными текущего пользователя
+        и часто меняющимися счетчиками рецепта.
+        """
+        request = self.context.get('request')
+        author = dict(fragment['author'])
+        # Подписка берется из аннотации рецепта, если она есть: тогда
+        # автор для рецептов с фрагментом в кэше не загружается.
+        author['is_subscribed'] = getattr(recipe, 'is_subscribed', None)
+        if author['is_subscribed'] is None:
+            author['is_subscribed'] = (
+                self.fields['author'].get_is_subscribed(recipe.author))
+        if request and author['avatar']:
+            author['avatar'] = request.build_absolute_uri(author['avatar'])
+        author['avatar_variants'] = absolute_variants(
+            author['avatar_variants'], request)
+        author['avatar'] = pick_image(
+            author['avatar'], author['avatar_variants'], request)
+        representation = dict(
+            fragment,
+            author={field: author[field]
+                    for field in CustomUserSerializer.Meta.fields},
+            is_favorited=getattr(recipe, 'is_favorited', False),
+            is_in_shopping_cart=getattr(recipe, 'is_in_shopping_cart', False),
+            favorites_count=recipe.favorites_count,
+            in_carts_count=recipe.in_carts_count,
+        )
+        if request and representation['image']:
+            representation['image'] = request.build_absolute_uri(
+                representation['image'])
+        representation['image_variants'] = absolute_variants(
+            representation['image_variants'], request)
+        representation['image'] = pick_image(
+            representation['image'], representation['image_variants'],
+            request)
+        return {field: representation[field] for field in self.Meta.fields}
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            fragments = get_recipe_fragments(
+                [instance], self.build_fragments)
+            return self.merge_user_data(instance, fragments[instance.pk])
 
 
 class IngredientCreateSerializer(ModelSerializer):
@@ -156,8 +292,7 @@ class IngredientCreateSerializer(ModelSerializer):
 class RecipeCreateSerializer(ModelSerializer):
     """Серилизатор для Создания и обновления рецептов."""
 
-    tags = PrimaryKeyRelatedField(
-        many=True,
+    tags = PrimaryKeyListField(
         queryset=Tag.objects.all(),
         required=True
     )
@@ -198,14 +333,16 @@ class RecipeCreateSerializer(ModelSerializer):
         if not ingredients:
             raise ValidationError('Поле ingredients обязательно.')
 
-        ingredienеts_list = [ingredient['id'] for ingredient in ingredients]
-        if len(ingredienеts_list) != len(set(ingredienеts_list)):
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
             raise ValidationError(
                 'Ингредиенты должны быть уникальными.')
 
+        existing_ids = set(Ingredient.objects.filter(
+            id__in=ingredient_ids).values_list('id', flat=True))
         non_existing_ingredients = [
-            ingredient_id for ingredient_id in ingredienеts_list
-            if not Ingredient.objects.filter(id=ingredient_id).exists()
+            ingredient_id for ingredient_id in ingredient_ids
+            if ingredient_id not in existing_ids
         ]
         if non_existing_ingredients:
             raise ValidationError(
@@ -229,80 +366,116 @@ class RecipeCreateSerializer(ModelSerializer):
         validated_data.pop('author', None)
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
-
-        ingredient_ids = [ingredient_data.get('id')
-                          for ingredient_data in ingredients_data]
-        ingredients = Ingredient.objects.filter(id__in=ingredient_ids)
-        ingredient_dict = {
-            ingredient.id: ingredient for ingredient in ingredients}
-
-        recipe_ingredients = []
-        for ingredient_data in ingredients_data:
-            ingredient_id = ingredient_data.get('id')
-            amount = ingredient_data.get('amount')
-            ingredient = ingredient_dict.get(ingredient_id)
-            if ingredient:
-                recipe_ingredients.append(
-                    RecipeIngredient(
-                        recipe=recipe,
-                        ingredient=ingredient,
-                        amount=amount
-                    )
-                )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
-        return recipe
-
-    def create_ingredients(self, ingredients, recipe):
-        """Создает и связывает ингредиенты с рецептом."""
-
-        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
-        ingredient_instances = Ingredient.objects.filter(id__in=ingredient_ids)
-        ingredient_dict = {
-            ingredient.id: ingredient for ingredient in ingredient_instances}
-        ingredients_list = [
+        RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                amount=ingredient['amount'],
-                ingredient=ingredient_dict[ingredient['id']]
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
             )
+            for ingredient in ingredients_data
+        )
+        prefetch_related_objects([recipe], Prefetch(
+            'recipeingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ))
+        return recipe
+
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к переданным, меняя только
+        отличающиеся строки.
+        """
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipeingredients.all()
+        }
+        incoming = {
+            ingredient['id']: ingredient['amount']
             for ingredient in ingredients
+        }
+        to_delete = [
+            recipe_ingredient.pk
+            for ingredient_id, recipe_ingredient in current.items()
+            if ingredient_id not in incoming
         ]
-        RecipeIngredient.objects.bulk_create(ingredients_list)
+        to_update = []
+        deltas = {}
+        for ingredient_id, amount in incoming.items():
+            recipe_ingredient = current.get(ingredient_id)
+            old_amount = recipe_ingredient.amount if recipe_ingredient else 0
+            if amount == old_amount:
+                continue
+            deltas[ingredient_id] = amount - old_amount
+            if recipe_ingredient:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        for ingredient_id, recipe_ingredient in current.items():
+            if ingredient_id not in incoming:
+                deltas[ingredient_id] = -recipe_ingredient.amount
+        if not deltas:
+            return
+
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in incoming.items()
+            if ingredient_id not in current
+        ])
+        apply_recipe_deltas(recipe.pk, deltas)
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновляет существующий рецепт."""
+        """Обновляет рецепт, записывая только изменившиеся связи."""
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
 
         if ingredients is None:
             raise ValidationError(
                 'Поле "ingredients" обязательно для обновления рецепта.')
-        instance = super().update(instance, validated_data)
-
-        if tags is not None:
+        if tags is not None and (
+                {tag.pk for tag in tags}
+                != {tag.pk for tag in instance.tags.all()}):
             instance.tags.set(tags)
-        if ingredients is not None:
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
-        instance.save()
-
-        return instance
+        self.update_ingredients(instance, ingredients)
+        # Рецепт сохраняется один раз, уже после связей: auto_now
+        # обновляет updated_at, от которого зависят фрагменты и ETag.
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         """Используем RecipeGetSerializer для формирования ответа."""
         return RecipeGetSerializer(instance, context=self.context).data
 
 
-class RecipeShortSerializer(ModelSerializer):
+class RecipeShortSerializer(TimedRepresentationMixin, ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField(source='image_derivatives')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeBatchSerializer(Serializer):
+    """Список id рецептов для пакетного изменения избранного/корзины."""
+
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
 
-class ShortLinkSerializer(ModelSerializer):
+class ShortLinkSerializer(TimedRepresentationMixin, ModelSerializer):
     """Сериализатор для короткой ссылки."""
     short_link = SerializerMethodField()
 
@@ -0,0 +1,141 @@
+import csv
+import os
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+from recipes.constants import (
+    SHOPPING_LIST_CHUNK_SIZE, SHOPPING_LIST_PDF_FONT_SIZE,
+    SHOPPING_LIST_SPOOL_SIZE)
+from recipes.models import ShoppingCartIngredient
+
+
+def get_shopping_list_rows(user):
+    """Итерирует по итогам корзины пользователя курсором на сервере."""
+    return ShoppingCartIngredient.objects.filter(
+        user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount'
+    ).order_by(
+        'ingredient__name'
+    ).iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+
+
+def format_row(row):
+    return (
+        f'- {row["ingredient__name"]} '
+        f'({row["ingredient__measurement_unit"]})'
+        f' - {row["amount"]}'
+    )
+
+
+def render_txt(user, rows):
+    today = datetime.today()
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n\n'
+        f'Дата: {today:%Y-%m-%d}\n\n'
+    )
+    separator = ''
+    for row in rows:
+        yield f'{separator}{format_row(row)}'
+        separator = '\n'
+    yield f'\n\nFoodgram ({today:%Y})'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(user, rows):
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['amount'],
+        ))
+
+
+def get_pdf_font():
+    """
+    Регистрирует шрифт из SHOPPING_LIST_PDF_FONT. Встроенные шрифты PDF
+    не содержат кириллицы, поэтому без файла шрифта список не строится.
+    """
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if not os.path.isfile(font_path):
+        raise ImproperlyConfigured(
+            f'SHOPPING_LIST_PDF_FONT: font file {font_path} not found.')
+    font_name = os.path.splitext(os.path.basename(font_path))[0]
+    if font_name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+    return font_name
+
+
+def render_pdf(user, rows):
+    """
+    Проверяет шрифт до начала ответа: ошибка внутри потока оборвала бы
+    уже отправленный файл.
+    """
+    return draw_pdf(user, rows, get_pdf_font())
+
+
+def draw_pdf(user, rows, font):
+    """
+    Рисует PDF построчно во временный файл.
+
+    Формат PDF не позволяет отдавать документ до записи таблицы
+    ссылок в конце, поэтому в памяти держится не больше
+    SHOPPING_LIST_SPOOL_SIZE байт, остальное сбрасывается на диск,
+    а готовый файл отдается частями.
+    """
+    today = datetime.today()
+    line_height = SHOPPING_LIST_PDF_FONT_SIZE * 1.5
+    width, height = A4
+    margin = 20 * mm
+    buffer = SpooledTemporaryFile(max_size=SHOPPING_LIST_SPOOL_SIZE)
+    canvas = Canvas(buffer, pagesize=A4)
+    canvas.setTitle(f'Список покупок для: {user.get_full_name()}')
+    y = height - margin
+
+    def write_line(text=''):
+        nonlocal y
+        if y < margin:
+            canvas.showPage()
+            y = height - margin
+        canvas.setFont(font, SHOPPING_LIST_PDF_FONT_SIZE)
+        canvas.drawString(margin, y, text)
+        y -= line_height
+
+    write_line(f'Список покупок для: {user.get_full_name()}')
+    write_line()
+    write_line(f'Дата: {today:%Y-%m-%d}')
+    write_line()
+    for row in rows:
+        write_line(format_row(row))
+    write_line()
+    write_line(f'Foodgram ({today:%Y})')
+    canvas.save()
+    buffer.seek(0)
+    yield from FileWrapper(buffer, SHOPPING_LIST_SPOOL_SIZE // 16)
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
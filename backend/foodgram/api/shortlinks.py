@@ -0,0 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from recipes.constants import (
+    MAX_LENGTH_SHORTLINK, SHORT_LINK_CACHE_TIMEOUT, SHORT_LINK_LRU_SIZE,
+    SHORT_LINK_LRU_TIMEOUT)
+from recipes.models import Recipe, ShortLink
+from recipes.shortlinks import decode_short_link
+
+from .cache import LRUCache
+
+SHORT_LINK_KEY = 'short-link:{code}'
+
+local_cache = LRUCache(SHORT_LINK_LRU_SIZE, SHORT_LINK_LRU_TIMEOUT)
+
+
+def lookup_short_link(code):
+    """Находит id рецепта по коду в БД."""
+    recipe_id = decode_short_link(code)
+    if recipe_id is None:
+        return ShortLink.objects.filter(
+            short_link=code).values_list('recipe_id', flat=True).first()
+    if Recipe.objects.filter(pk=recipe_id).exists():
+        return recipe_id
+    return None
+
+
+def resolve_short_link(code):
+    """
+    Возвращает id рецепта по коду: сначала из LRU процесса, затем из
+    общего кэша и только при промахе обоих — из БД.
+    """
+    if len(code) > MAX_LENGTH_SHORTLINK:
+        return None
+    recipe_id = local_cache.get(code)
+    if recipe_id is not None:
+        return recipe_id
+    key = SHORT_LINK_KEY.format(code=code)
+    recipe_id = cache.get(key)
+    if recipe_id is None:
+        recipe_id = lookup_short_link(code)
+        if recipe_id is None:
+            return None
+        cache.set(key, recipe_id, SHORT_LINK_CACHE_TIMEOUT)
+    local_cache.set(code, recipe_id)
+    return recipe_id
+
+
+async def aresolve_short_link(code):
+    """
+    Асинхронный вариант resolve_short_link: попадание в LRU отдается
+    без переключения потоков, в поток уходит только запрос к БД.
+    """
+    if len(code) > MAX_LENGTH_SHORTLINK:
+        return None
+    recipe_id = local_cache.get(code)
+    if recipe_id is not None:
+        return recipe_id
+    key = SHORT_LINK_KEY.format(code=code)
+    recipe_id = await cache.aget(key)
+    if recipe_id is None:
+        recipe_id = await sync_to_async(lookup_short_link)(code)
+        if recipe_id is None:
+            return None
+        await cache.aset(key, recipe_id, SHORT_LINK_CACHE_TIMEOUT)
+    local_cache.set(code, recipe_id)
+    return recipe_id
+
+
+def forget_short_link(code):
+    local_cache.delete(code)
+    cache.delete(SHORT_LINK_KEY.format(code=code))
@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, ShortLink, Tag
+from recipes.shortlinks import encode_short_link
+
+from .authentication import forget_token
+from .autocomplete import invalidate_ingredient_index
+from .cache import (
+    bump_fragment_generation, bump_recipe_version, bump_recipe_versions,
+    bump_tags_version)
+from .shortlinks import forget_short_link
+
+User = get_user_model()
+
+# Поля пользователя, которые попадают во фрагмент рецепта как автор.
+AUTHOR_FRAGMENT_FIELDS = frozenset((
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_derivatives'))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    bump_recipe_version(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_short_link(sender, instance, **kwargs):
+    forget_short_link(encode_short_link(instance.pk))
+
+
+@receiver(post_delete, sender=ShortLink)
+def forget_legacy_short_link(sender, instance, **kwargs):
+    if instance.short_link:
+        forget_short_link(instance.short_link)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    bump_recipe_version(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_relations(sender, instance, action, reverse,
+                                pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_recipe_version(instance.pk)
+    elif pk_set is None:
+        bump_fragment_generation()
+    else:
+        for recipe_id in pk_set:
+            bump_recipe_version(recipe_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_reference_data(sender, **kwargs):
+    bump_fragment_generation()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_tags_version()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    invalidate_ingredient_index()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает фрагменты только рецептов этого автора."""
+    if created or update_fields and not (
+            AUTHOR_FRAGMENT_FIELDS & update_fields):
+        return
+    bump_recipe_versions(list(Recipe.objects.filter(
+        author=instance).values_list('pk', flat=True)))
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        forget_token(key)
@@ -0,0 +1,975 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.constants import IMAGE_SIZES
+from recipes.images import output_formats, update_derivatives
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCartIngredient,
+    ShoppingList, ShortLink, Tag)
+from recipes.search import update_search_vectors
+from recipes.shopping_cart import get_live_totals
+from recipes.shortlinks import encode_short_link
+from users.models import Subscribe, User
+
+from . import async_views
+from .authentication import local_cache
+from .autocomplete import (
+    IngredientIndex, invalidate_ingredient_index, prefix_distance)
+from .cache import (
+    GENERATION_KEY, VERSION_KEY, bump_recipe_version, get_versions,
+    reference_cache)
+from .metrics import registry
+from .shortlinks import SHORT_LINK_KEY
+from .shortlinks import local_cache as short_link_cache
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(
+        'image.png', buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_DERIVATIVES_ASYNC=False)
+class APITestCase(TestCase):
+    """Общие данные: пользователи, теги, ингредиенты и рецепты."""
+
+    recipes_count = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password-12345',
+            )
+            for number in range(3)
+        ]
+        cls.user = cls.users[0]
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        ]
+        cls.recipes = [
+            cls.create_recipe(cls.users[number % 3], number)
+            for number in range(cls.recipes_count)
+        ]
+
+    @classmethod
+    def create_recipe(cls, author, number, tags=None):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=10,
+            image=make_image(),
+        )
+        recipe.tags.set(tags if tags is not None else cls.tags[:2])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=cls.ingredients[(number + shift) % 20],
+                amount=shift + 1
+            )
+            for shift in range(3)
+        )
+        return recipe
+
+    @staticmethod
+    def clear_caches():
+        cache.clear()
+        reference_cache.clear()
+        local_cache.clear()
+        short_link_cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.clear_caches()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeQueriesTest(APITestCase):
+    """
+    Число запросов к БД на чтение рецептов не зависит от числа рецептов
+    на странице, их тегов, ингредиентов и авторов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Subscribe.objects.create(user=cls.user, author=cls.users[1])
+        for recipe in cls.recipes[:4]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def assertListQueries(self, client, cold, warm):
+        """
+        cold — запросы с пустым кэшем, warm — когда фрагменты всех
+        рецептов страницы уже в кэше: только COUNT и страница.
+        """
+        for limit in (2, self.recipes_count):
+            self.clear_caches()
+            for number in (cold, warm):
+                with self.subTest(limit=limit, queries=number), \
+                        self.assertNumQueries(number):
+                    response = client.get('/api/recipes/', {'limit': limit})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assertListQueries(self.anonymous, 5, 2)
+
+    def test_list_authenticated(self):
+        self.assertListQueries(self.client, 6, 3)
+
+    def test_list_partly_cached(self):
+        self.client.get('/api/recipes/', {'limit': self.recipes_count})
+        Recipe.objects.filter(pk=self.recipes[3].pk).update(name='Новое')
+        bump_recipe_version(self.recipes[3].pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/recipes/', {'limit': self.recipes_count})
+        self.assertEqual(len(queries), 6)
+        reload = queries[3]['sql']
+        self.assertIn(f'IN ({self.recipes[3].pk})', reload)
+        names = {recipe['id']: recipe['name']
+                 for recipe in response.data['results']}
+        self.assertEqual(names[self.recipes[3].pk], 'Новое')
+
+    def test_list_authenticated_flags(self):
+        response = self.client.get(
+            '/api/recipes/', {'limit': self.recipes_count})
+        results = {recipe['id']: recipe for recipe in response.data['results']}
+        for recipe in self.recipes:
+            with self.subTest(recipe=recipe.pk):
+                favorited = recipe in self.recipes[:4]
+                self.assertEqual(
+                    results[recipe.pk]['is_favorited'], favorited)
+                self.assertEqual(
+                    results[recipe.pk]['is_in_shopping_cart'], favorited)
+                self.assertEqual(
+                    results[recipe.pk]['author']['is_subscribed'],
+                    recipe.author == self.users[1])
+
+    def test_detail_anonymous(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        for number in (4, 1):
+            with self.subTest(queries=number), self.assertNumQueries(number):
+                response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_detail_authenticated(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        for number in (5, 2):
+            with self.subTest(queries=number), self.assertNumQueries(number):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.data['is_favorited'])
+            self.assertFalse(response.data['author']['is_subscribed'])
+
+
+class SubscriptionsQueriesTest(APITestCase):
+    """
+    Число запросов на список подписок не зависит от числа авторов и
+    recipes_limit.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.authors = cls.users[1:] + [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}', first_name='Имя',
+                last_name='Фамилия', password='password-12345')
+            for number in range(3)
+        ]
+        for number, author in enumerate(cls.authors[2:]):
+            for recipe_number in range(number + 1):
+                cls.create_recipe(author, 100 + recipe_number)
+
+    def subscriptions(self, **params):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_queries(self):
+        for count in (1, len(self.authors)):
+            Subscribe.objects.filter(user=self.user).delete()
+            Subscribe.objects.bulk_create(
+                Subscribe(user=self.user, author=author)
+                for author in self.authors[:count])
+            for limit in (None, 1, 2):
+                params = {} if limit is None else {'recipes_limit': limit}
+                with self.subTest(authors=count, limit=limit):
+                    results = self.subscriptions(**params)
+                    self.assertEqual(len(results), count)
+                    for author in results:
+                        total = Recipe.objects.filter(
+                            author_id=author['id']).count()
+                        self.assertEqual(author['recipes_count'], total)
+                        self.assertEqual(
+                            len(author['recipes']),
+                            total if limit is None else min(limit, total))
+
+
+class RecipeCursorPaginationTest(APITestCase):
+    """Курсор (created_at, id) не теряет и не повторяет рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        created_at = cls.recipes[0].created_at
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in cls.recipes[2:9]]
+        ).update(created_at=created_at)
+
+    def walk(self, url, direction):
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any(
+                'OFFSET' in query['sql'] for query in queries))
+            page = [recipe['id'] for recipe in response.data['results']]
+            ids = page + ids if direction == 'previous' else ids + page
+            url = response.data[direction]
+        return ids
+
+    def test_pages_follow_ordering(self):
+        expected = list(Recipe.objects.order_by(
+            '-created_at', 'id').values_list('pk', flat=True))
+        forward = self.walk(
+            '/api/recipes/?pagination=cursor&limit=4', 'next')
+        self.assertEqual(forward, expected)
+
+        response = self.anonymous.get(
+            '/api/recipes/?pagination=cursor&limit=4')
+        last = response.data['next']
+        while True:
+            response = self.anonymous.get(last)
+            if response.data['next'] is None:
+                break
+            last = response.data['next']
+        self.assertEqual(
+            self.walk(response.data['previous'], 'previous'),
+            expected[:-len(response.data['results'])]
+        )
+
+    def test_invalid_cursor(self):
+        response = self.anonymous.get('/api/recipes/?cursor=cD0x')
+        self.assertEqual(response.status_code, 404)
+
+
+class AuthorInvalidationTest(APITestCase):
+    """Изменение автора сбрасывает фрагменты только его рецептов."""
+
+    def versions(self):
+        keys = [GENERATION_KEY, *(
+            VERSION_KEY.format(pk=recipe.pk) for recipe in self.recipes)]
+        return dict(zip(keys, get_versions(*keys)))
+
+    def test_author_change(self):
+        author = self.users[1]
+        recipe = self.recipes[1]
+        self.anonymous.get(f'/api/recipes/{recipe.pk}/')
+        before = self.versions()
+        author.first_name = 'Новое'
+        author.save()
+        after = self.versions()
+        self.assertEqual(after[GENERATION_KEY], before[GENERATION_KEY])
+        for recipe in self.recipes:
+            key = VERSION_KEY.format(pk=recipe.pk)
+            with self.subTest(recipe=recipe.pk):
+                if recipe.author == author:
+                    self.assertNotEqual(after[key], before[key])
+                else:
+                    self.assertEqual(after[key], before[key])
+        response = self.anonymous.get(f'/api/recipes/{self.recipes[1].pk}/')
+        self.assertEqual(response.data['author']['first_name'], 'Новое')
+
+    def test_unrelated_fields(self):
+        before = self.versions()
+        self.users[1].save(update_fields=['last_login', 'is_active'])
+        self.assertEqual(self.versions(), before)
+
+
+class ShoppingListPDFTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        ShoppingList.objects.create(user=self.user, recipe=self.recipes[0])
+
+    def download(self):
+        return self.client.get(
+            '/api/recipes/download_shopping_cart/', {'file_format': 'pdf'})
+
+    def test_embeds_cyrillic_font(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+
+    def test_missing_font(self):
+        with override_settings(SHOPPING_LIST_PDF_FONT='/nonexistent.ttf'):
+            with self.assertRaises(ImproperlyConfigured):
+                self.download()
+
+
+class RecipeBatchTest(APITestCase):
+    """Пакетные изменения считают только реально измененные строки."""
+
+    def counters(self, field):
+        return dict(Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in self.recipes[:3]]
+        ).values_list('pk', field))
+
+    def batch(self, method, url, recipes):
+        response = getattr(self.client, method)(
+            url, {'recipes': recipes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']]
+
+    def test_favorites(self):
+        first, second, third = (recipe.pk for recipe in self.recipes[:3])
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        url = '/api/recipes/favorite/batch/'
+        self.assertEqual(
+            self.batch('post', url, [first, second, third, 10 ** 6]),
+            ['already_added', 'added', 'added', 'not_found'])
+        self.assertEqual(
+            self.counters('favorites_count'),
+            {first: 1, second: 1, third: 1})
+        self.assertEqual(
+            self.batch('delete', url, [first, second, second]),
+            ['removed', 'removed'])
+        self.assertEqual(
+            self.counters('favorites_count'),
+            {first: 0, second: 0, third: 1})
+
+    def test_shopping_cart_totals(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        recipes = [recipe.pk for recipe in self.recipes[:3]]
+        self.batch('post', url, recipes)
+        self.batch('delete', url, recipes[:1])
+        self.assertEqual(
+            self.counters('in_carts_count'),
+            {recipes[0]: 0, recipes[1]: 1, recipes[2]: 1})
+        totals = dict(ShoppingCartIngredient.objects.filter(
+            user=self.user).values_list('ingredient_id', 'amount'))
+        expected = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id__in=recipes[1:]).values_list(
+                    'ingredient_id', 'amount'):
+            expected[ingredient_id] = expected.get(ingredient_id, 0) + amount
+        self.assertEqual(totals, expected)
+
+
+class RecipeETagTest(APITestCase):
+    """ETag ленты строится по рецептам запрошенной страницы."""
+
+    url = '/api/recipes/'
+
+    def get(self, client, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return client.get(self.url, params, headers=headers)
+
+    def test_user_flags_change_etag(self):
+        for recipe in (self.recipes[-1], self.recipes[-4]):
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        etag = self.get(self.client)['ETag']
+        Favorite.objects.filter(user=self.user).delete()
+        for recipe in (self.recipes[-2], self.recipes[-3]):
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        response = self.get(self.client, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        favorited = {
+            recipe['id'] for recipe in response.data['results']
+            if recipe['is_favorited']
+        }
+        self.assertEqual(
+            favorited, {self.recipes[-2].pk, self.recipes[-3].pk})
+
+    def test_not_modified_without_serialization(self):
+        etag = self.get(self.anonymous)['ETag']
+        with self.assertNumQueries(2):
+            response = self.get(self.anonymous, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_other_page_change(self):
+        etag = self.get(self.anonymous, limit=2)['ETag']
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(
+            self.get(self.anonymous, etag, limit=2).status_code, 304)
+        Favorite.objects.create(user=self.user, recipe=self.recipes[-1])
+        self.assertEqual(
+            self.get(self.anonymous, etag, limit=2).status_code, 200)
+
+    def test_cursor_mode_skips_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(self.anonymous, pagination='cursor')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'].upper() for query in queries))
+
+    def test_detail_without_last_modified(self):
+        response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertIn('ETag', response)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class ReferenceETagTest(APITestCase):
+    """ETag тегов и ингредиентов."""
+
+    def get(self, url, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.anonymous.get(url, params, headers=headers)
+
+    def test_tag_save_changes_etag(self):
+        tag = self.tags[0]
+        for url in ('/api/tags/', f'/api/tags/{tag.pk}/'):
+            with self.subTest(url=url):
+                etag = self.get(url)['ETag']
+                self.assertEqual(self.get(url, etag).status_code, 304)
+                tag.save()
+                response = self.get(url, etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_url_and_format(self):
+        tag = self.tags[0]
+        responses = (
+            self.get('/api/tags/'),
+            self.get(f'/api/tags/{tag.pk}/'),
+            self.get('/api/tags/', format='api'),
+            self.get('/api/ingredients/'),
+            self.get('/api/ingredients/', name='ингредиент 1'),
+            self.get('/api/ingredients/', name='ингредиент 2'),
+        )
+        etags = [response['ETag'] for response in responses]
+        self.assertEqual(len(set(etags)), len(etags))
+        self.assertEqual(
+            self.get(f'/api/tags/{tag.pk}/', etags[0]).status_code, 200)
+
+
+class RecipeTagFilterTest(APITestCase):
+    """Фильтр по нескольким тегам не размножает рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Кроме рецептов с tag0 и tag1: по два с tag2, с tag1 и tag2
+        # и без тегов.
+        for number, tags in enumerate(
+                2 * [[cls.tags[2]], [cls.tags[1], cls.tags[2]], []],
+                start=cls.recipes_count):
+            cls.create_recipe(cls.user, number, tags=tags)
+
+    def filter(self, *tags, **params):
+        response = self.anonymous.get('/api/recipes/', {
+            'tags': [tag.slug for tag in tags], 'limit': 100, **params})
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(response.data['count'], len(ids))
+        return set(ids)
+
+    def recipes_with(self, *tags):
+        return {
+            recipe.pk for recipe in Recipe.objects.all()
+            if set(tags) <= set(recipe.tags.all())
+        }
+
+    def test_match_any(self):
+        tags = (self.tags[0], self.tags[1], self.tags[2])
+        expected = {
+            recipe.pk for recipe in Recipe.objects.filter(tags__in=tags)}
+        self.assertEqual(len(expected), self.recipes_count + 4)
+        self.assertEqual(self.filter(*tags), expected)
+        self.assertEqual(self.filter(*tags, tags_match='any'), expected)
+
+    def test_match_all(self):
+        for tags in ((self.tags[0], self.tags[1]),
+                     (self.tags[1], self.tags[2]),
+                     (self.tags[0], self.tags[2])):
+            with self.subTest(tags=[tag.slug for tag in tags]):
+                self.assertEqual(
+                    self.filter(*tags, tags_match='all'),
+                    self.recipes_with(*tags))
+        self.assertEqual(
+            len(self.filter(self.tags[1], self.tags[2], tags_match='all')), 2)
+        self.assertEqual(
+            self.filter(self.tags[0], self.tags[2], tags_match='all'), set())
+
+
+class RecipeSearchTest(APITestCase):
+    """
+    Поиск по названию, описанию и ингредиентам: полнотекстовый на
+    PostgreSQL и по подстроке на SQLite (DB_ENGINE=sqlite).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.potato = Ingredient.objects.create(
+            name='картофель', measurement_unit='г')
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г')
+        cls.soup = cls.create_search_recipe(
+            'Борщ', 'Суп на говяжьем бульоне', cls.potato)
+        cls.pancakes = cls.create_search_recipe(
+            'Оладьи', 'Пышные оладьи на кефире', cls.flour)
+        # bulk_create не отправляет сигналы, индекс строится явно.
+        update_search_vectors(Recipe.objects.all())
+
+    @classmethod
+    def create_search_recipe(cls, name, text, ingredient):
+        recipe = Recipe.objects.create(
+            author=cls.user, name=name, text=text, cooking_time=10,
+            image=make_image())
+        recipe.tags.set(cls.tags[:1])
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=100)
+        return recipe
+
+    def search(self, query):
+        response = self.anonymous.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.data['results']}
+
+    def test_search(self):
+        for query, expected in (('Борщ', {'Борщ'}),
+                                ('кефире', {'Оладьи'}),
+                                ('картофель', {'Борщ'}),
+                                ('Борщ картофель', {'Борщ'}),
+                                ('ананас', set())):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), expected)
+
+    def test_search_after_ingredients_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.pancakes.pk}/', {
+                    'ingredients': [{'id': self.potato.pk, 'amount': 50}],
+                    'tags': [self.tags[0].pk],
+                    'name': 'Оладьи',
+                    'text': 'Пышные оладьи на кефире',
+                    'cooking_time': 10,
+                }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('картофель'), {'Борщ', 'Оладьи'})
+        self.assertEqual(self.search('мука'), set())
+
+    def test_search_after_ingredient_rename(self):
+        self.flour.name = 'пшеничная мука'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour.save()
+        self.assertEqual(self.search('пшеничная'), {'Оладьи'})
+
+
+class ImageSizeTest(APITestCase):
+    """?image_size= подменяет изображение готовой WebP-копией."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+        update_derivatives(
+            Recipe, self.recipe.pk, 'image', 'image_derivatives')
+        self.recipe.refresh_from_db()
+
+    def image(self, recipe, **params):
+        response = self.anonymous.get(f'/api/recipes/{recipe.pk}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['image']
+
+    def test_image_size(self):
+        derivatives = self.recipe.image_derivatives
+        for size in IMAGE_SIZES:
+            with self.subTest(size=size):
+                self.assertTrue(self.image(self.recipe, image_size=size)
+                                .endswith(derivatives[f'{size}.webp']))
+        original = self.image(self.recipe)
+        self.assertTrue(original.endswith(self.recipe.image.name))
+        self.assertEqual(self.image(self.recipe, image_size='huge'), original)
+
+    def test_variants(self):
+        response = self.anonymous.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(
+            {size: set(urls)
+             for size, urls in response.data['image_variants'].items()},
+            {size: set(output_formats()) for size in IMAGE_SIZES})
+
+    def test_without_derivatives(self):
+        recipe = self.recipes[1]
+        self.assertEqual(recipe.image_derivatives, {})
+        self.assertEqual(
+            self.image(recipe, image_size='small'), self.image(recipe))
+
+
+class RecipeCreateQueriesTest(APITestCase):
+    """Число запросов на создание рецепта не зависит от числа
+    ингредиентов и тегов."""
+
+    image = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+        'FcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=='
+    )
+
+    def create(self, ingredients, tags):
+        return self.client.post('/api/recipes/', {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 5}
+                for ingredient in ingredients
+            ],
+            'tags': [tag.pk for tag in tags],
+            'image': self.image,
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }, format='json')
+
+    def test_create(self):
+        for ingredients, tags in ((self.ingredients[:1], self.tags[:1]),
+                                  (self.ingredients[:10], self.tags)):
+            with self.subTest(ingredients=len(ingredients), tags=len(tags)):
+                self.clear_caches()
+                with self.assertNumQueries(13):
+                    response = self.create(ingredients, tags)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(
+                    len(response.data['ingredients']), len(ingredients))
+
+
+class ShortLinkTest(APITestCase):
+    """Переход по короткой ссылке на рецепт."""
+
+    def follow(self, code):
+        return self.anonymous.get(f'/s/{code}/')
+
+    def test_legacy_code(self):
+        recipe = self.recipes[0]
+        ShortLink.objects.create(recipe=recipe, short_link='xY7')
+        response = self.follow('xY7')
+        self.assertRedirects(
+            response, f'/recipes/{recipe.pk}/', fetch_redirect_response=False)
+        self.assertEqual(self.follow('xY8').status_code, 404)
+
+    def test_cached(self):
+        recipe = self.recipes[0]
+        code = encode_short_link(recipe.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.follow(code).status_code, 302)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.follow(code).status_code, 302)
+        # Промах LRU процесса: код берется из общего кэша.
+        short_link_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.follow(code).status_code, 302)
+
+    def test_deleted_recipe(self):
+        recipe = self.recipes[0]
+        code = encode_short_link(recipe.pk)
+        self.assertEqual(self.follow(code).status_code, 302)
+        self.assertEqual(short_link_cache.get(code), recipe.pk)
+        recipe.delete()
+        self.assertIsNone(short_link_cache.get(code))
+        self.assertIsNone(cache.get(SHORT_LINK_KEY.format(code=code)))
+        self.assertEqual(self.follow(code).status_code, 404)
+
+    def test_unknown_recipe(self):
+        code = encode_short_link(Recipe.objects.order_by('pk').last().pk + 1)
+        self.assertEqual(self.follow(code).status_code, 404)
+        self.assertIsNone(short_link_cache.get(code))
+
+
+class RecipeUpdateTest(APITestCase):
+    """
+    Обновление рецепта меняет только отличающиеся ингредиенты, а суммы
+    в корзинах остаются равны пересчитанным заново.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = cls.recipes[0]
+        for user in cls.users[:2]:
+            for recipe in cls.recipes[:2]:
+                ShoppingList.objects.create(user=user, recipe=recipe)
+
+    def update(self, amounts):
+        return self.client.patch(f'/api/recipes/{self.recipe.pk}/', {
+            'ingredients': [
+                {'id': self.ingredients[number].pk, 'amount': amount}
+                for number, amount in amounts.items()
+            ],
+            'tags': [tag.pk for tag in self.tags[:2]],
+        }, format='json')
+
+    def assertAmounts(self, amounts):
+        self.assertEqual(
+            dict(self.recipe.recipeingredients.values_list(
+                'ingredient_id', 'amount')),
+            {self.ingredients[number].pk: amount
+             for number, amount in amounts.items()})
+        self.assertEqual(
+            {(user_id, ingredient_id): amount
+             for user_id, ingredient_id, amount
+             in ShoppingCartIngredient.objects.values_list(
+                 'user_id', 'ingredient_id', 'amount')},
+            {(user_id, ingredient_id): total
+             for user_id, ingredient_id, total in get_live_totals()})
+
+    def test_update_ingredients(self):
+        # Исходные ингредиенты рецепта: 0, 1 и 2 в количестве 1, 2 и 3.
+        for name, amounts in (('unchanged', {0: 1, 1: 2, 2: 3}),
+                              ('added', {0: 1, 1: 2, 2: 3, 5: 7}),
+                              ('removed', {0: 1, 5: 7}),
+                              ('amount', {0: 4, 5: 2}),
+                              ('replaced', {1: 2, 3: 1})):
+            with self.subTest(name):
+                response = self.update(amounts)
+                self.assertEqual(response.status_code, 200)
+                self.assertAmounts(amounts)
+                self.assertEqual(
+                    {ingredient['name']: ingredient['amount']
+                     for ingredient in response.data['ingredients']},
+                    {self.ingredients[number].name: amount
+                     for number, amount in amounts.items()})
+
+    def test_single_save(self):
+        updated_at = self.recipe.updated_at
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.update({0: 5}).status_code, 200)
+        table = Recipe._meta.db_table
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if query['sql'].startswith(f'UPDATE "{table}"')]), 1)
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.updated_at, updated_at)
+
+
+class MetricsTest(APITestCase):
+    """Замеры запросов в Server-Timing и /metrics."""
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def serializer_time(self, response):
+        timings = dict(
+            metric.strip().split(';')[:2]
+            for metric in response['Server-Timing'].split(','))
+        return float(timings['serializer'].removeprefix('dur='))
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_serializer_time(self):
+        author = self.users[1]
+        for method, url, status in (
+                ('post', f'/api/users/{author.pk}/subscribe/', 201),
+                ('get', '/api/users/subscriptions/', 200),
+                ('get', '/api/recipes/', 200)):
+            with self.subTest(url=url):
+                response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, status)
+                self.assertGreater(self.serializer_time(response), 0)
+
+    def test_header_disabled(self):
+        response = self.anonymous.get('/api/tags/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_unknown_method(self):
+        self.anonymous.generic('BREW', '/api/tags/')
+        metrics = registry.render().decode()
+        self.assertIn('method="other"', metrics)
+        self.assertNotIn('BREW', metrics)
+
+    def test_worker_label(self):
+        self.anonymous.get('/api/tags/')
+        response = self.anonymous.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            f'route="TagViewSet.list",worker="{os.getpid()}"',
+            response.content.decode())
+
+
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': f'{MEDIA_ROOT}/cache',
+    }
+}
+
+
+class IngredientIndexTest(APITestCase):
+    """Автодополнение ингредиентов по индексу в памяти процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Картофель', 'капуста', 'кабачок', 'Ёрш', 'мука'))
+
+    def names(self, query, index=None):
+        return [item['name']
+                for item in (index or IngredientIndex()).search(query)]
+
+    def test_prefix(self):
+        self.assertEqual(
+            self.names('ка'), ['кабачок', 'капуста', 'Картофель'])
+        self.assertEqual(self.names('КАР'), ['Картофель'])
+        self.assertEqual(self.names('ерш'), ['Ёрш'])
+        self.assertEqual(
+            [item['name'] for item in IngredientIndex().search('ка', 2)],
+            ['кабачок', 'капуста'])
+
+    def test_typos(self):
+        self.assertEqual(prefix_distance('кортофель', 'картофель', 2), 1)
+        self.assertIsNone(prefix_distance('морковь', 'картофель', 2))
+        for query, expected in (('кортофель', ['Картофель']),
+                                ('картафел', ['Картофель']),
+                                ('кпуста', ['капуста']),
+                                ('ко', []),
+                                ('огурец', [])):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), expected)
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_refresh(self):
+        self.clear_caches()
+        # Индексы двух процессов видят одну версию в общем кэше.
+        indexes = IngredientIndex(), IngredientIndex()
+        for index in indexes:
+            self.assertEqual(self.names('свекла', index), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('свекла', indexes[0]), [])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='Свекла', measurement_unit='г')])
+        self.assertEqual(self.names('свекла', indexes[0]), [])
+        invalidate_ingredient_index()
+        for index in indexes:
+            with self.assertNumQueries(1):
+                self.assertEqual(self.names('свекла', index), ['Свекла'])
+
+
+class TokenAuthenticationTest(APITestCase):
+    """Снимок пользователя по токену только для чтения и с общим кэшем."""
+
+    def token_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data, format='json')
+        return sum(
+            'authtoken_token' in query['sql'] for query in queries)
+
+    def test_process_cache_reads_database(self):
+        self.assertEqual(self.token_queries('get', '/api/users/me/'), 1)
+        self.assertEqual(self.token_queries('get', '/api/users/me/'), 1)
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_shared_cache(self):
+        self.clear_caches()
+        self.assertEqual(self.token_queries('get', '/api/users/me/'), 1)
+        self.assertEqual(self.token_queries('get', '/api/users/me/'), 0)
+        Token.objects.filter(pk=self.token.pk).delete()
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, 401)
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_writes_use_fresh_user(self):
+        self.clear_caches()
+        self.client.get('/api/users/me/')
+        # Изменение в обход сигналов: снимок в кэше остается старым.
+        User.objects.filter(pk=self.user.pk).update(first_name='Новое')
+        response = self.client.put('/api/users/me/avatar/', {
+            'avatar': RecipeCreateQueriesTest.image}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password-12345',
+            'new_password': 'new-password-12345',
+        }, format='json')
+        self.assertEqual(response.status_code, 204)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Новое')
+        self.assertTrue(user.avatar)
+        self.assertTrue(user.check_password('new-password-12345'))
+
+
+class AsyncViewsTest(APITestCase):
+    """Асинхронные вьюхи отвечают так же, как синхронные вьюсеты."""
+
+    factory = RequestFactory()
+
+    def call(self, view, url, params=None, headers=None, **kwargs):
+        request = self.factory.get(
+            url, params, headers={'Accept': 'application/json',
+                                  **(headers or {})})
+        response = async_to_sync(view)(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_recipe_list(self):
+        for params in ({}, {'page': 2, 'limit': 5},
+                       {'page': 'last', 'limit': 5},
+                       {'tags': ['tag0', 'tag1'], 'tags_match': 'all'},
+                       {'author': self.users[1].pk},
+                       {'page': 99}, {'page': 'first'},
+                       {'tags': 'missing'}, {'tags_match': 'none'},
+                       {'author': 'x'}):
+            with self.subTest(params=params):
+                expected = self.anonymous.get('/api/recipes/', params)
+                response = self.call(
+                    async_views.recipe_list, '/api/recipes/', params)
+                self.assertEqual(
+                    response.status_code, expected.status_code)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+                self.assertEqual(
+                    json.loads(response.content),
+                    json.loads(expected.content))
+
+    def test_missing_tag_not_modified(self):
+        etag = self.anonymous.get(f'/api/tags/{self.tags[0].pk}/')['ETag']
+        headers = {'If-None-Match': etag}
+        for pk, status in ((999, 404), (self.tags[0].pk, 304)):
+            with self.subTest(pk=pk):
+                self.assertEqual(self.anonymous.get(
+                    f'/api/tags/{pk}/', headers=headers).status_code, status)
+                self.assertEqual(self.call(
+                    async_views.tag_detail, f'/api/tags/{pk}/',
+                    headers=headers, pk=pk).status_code, status)
@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from users.views import CustomUserViewSet
 
+from . import async_views
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, get_short_link
 
 app_name = 'api'
@@ -20,3 +22,11 @@ urlpatterns = [
     path('recipes/<int:recipe_id>/get-link/', get_short_link, name='get-link'),
     path('', include(v1_router.urls)),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = [
+        path('tags/', async_views.tag_list),
+        path('tags/<int:pk>/', async_views.tag_detail),
+        path('ingredients/', async_views.ingredient_list),
+        path('recipes/', async_views.recipe_list),
+    ] + urlpatterns
@@ -1,75 +1,282 @@
-from datetime import datetime
-
-from django.db.models import BooleanField, Exists, OuterRef, Sum, Value
-from django.http import HttpResponse
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
 from django_filters.rest_framework import DjangoFilterBackend
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework import status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view
+from rest_framework.generics import get_object_or_404 as get_or_404
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from recipes.constants import (
+    INGREDIENT_INDEX_VERSION_KEY, PAGINATION_MODE_PARAM, REFERENCE_MAX_AGE,
+    SHOPPING_LIST_FORMAT_PARAM)
 from recipes.models import (
     Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingList, ShortLink,
     Tag)
+from recipes.relations import bulk_add_relations, bulk_remove_relations
+from recipes.shortlinks import encode_short_link
+from users.models import Subscribe
 
+from .autocomplete import ingredient_index
+from .cache import (
+    GENERATION_KEY, REFERENCE_KEY, TAGS_VERSION_KEY, VERSION_KEY,
+    fragment_version_keys, get_rendered_response, get_versions,
+    set_rendered_response)
+from .conditional import conditional_response, make_etag
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .metrics import registry
+from .pagination import CustomPagination, RecipeCursorPagination
 from .permissions import IsAuthorOrAdmin
 from .serializers import (
-    IngredientSerializer, RecipeCreateSerializer, RecipeGetSerializer,
-    RecipeShortSerializer, ShortLinkSerializer, TagSerializer)
+    IngredientSerializer, RecipeBatchSerializer, RecipeCreateSerializer,
+    RecipeGetSerializer, RecipeShortSerializer, ShortLinkSerializer,
+    TagSerializer)
+from .shopping_list import SHOPPING_LIST_FORMATS, get_shopping_list_rows
+from .shortlinks import resolve_short_link
+
+User = get_user_model()
+
+# Поля рецепта и флаги пользователя, от которых зависит его представление
+# помимо кэшированного фрагмента.
+RECIPE_VALIDATOR_FIELDS = (
+    'pk', 'updated_at', 'favorites_count', 'in_carts_count',
+    'is_favorited', 'is_in_shopping_cart', 'is_subscribed',
+)
+# Поля, которые грузятся для страницы рецептов: для ETag, для ответа
+# поверх фрагмента и author_id, чтобы подгрузить автора для фрагмента.
+RECIPE_STATE_FIELDS = (
+    'author', 'created_at', 'updated_at', 'favorites_count', 'in_carts_count',
+)
+
+
+def false_flags(queryset, *names):
+    """Флаги пользователя для анонима: константы без подзапросов."""
+    false = Value(False, output_field=BooleanField())
+    return queryset.annotate(**dict.fromkeys(names, false))
+
+
+def anonymous_validators_queryset():
+    return false_flags(
+        Recipe.objects.all(),
+        'is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+
+
+def recipe_list_etag(recipes, envelope, versions):
+    """
+    ETag страницы рецептов: состояние каждого рецепта на ней, версии
+    их фрагментов и поля ответа вне results (count, next, previous).
+    """
+    return make_etag(
+        *versions,
+        [tuple(getattr(recipe, field) for field in RECIPE_VALIDATOR_FIELDS)
+         for recipe in recipes],
+        sorted((key, value) for key, value in envelope.items()
+               if key != 'results'),
+    )
+
+
+class VersionedReferenceMixin:
+    """
+    Справочник, который почти не меняется.
+
+    ETag и ключ кэша берутся из счетчика версии, который растет при любом
+    изменении; ответы без параметров хранятся в кэше готовыми байтами.
+    В ETag входят и адрес с параметрами, и формат ответа: иначе у списка,
+    объекта и HTML-страницы browsable API был бы один ETag.
+    """
+
+    version_key = None
+
+    def reference_response(self, request, get_response):
+        version, = get_versions(self.version_key)
+        etag = make_etag(
+            self.version_key, version, request.get_full_path(),
+            request.accepted_media_type)
+        response = conditional_response(
+            request, etag, None,
+            lambda: self.rendered_response(request, version, get_response),
+            vary=()
+        )
+        patch_cache_control(response, public=True, max_age=REFERENCE_MAX_AGE)
+        return response
+
+    def rendered_response(self, request, version, get_response):
+        renderer = request.accepted_renderer
+        if request.query_params or renderer.format != 'json':
+            return get_response()
+        key = REFERENCE_KEY.format(
+            version_key=self.version_key, version=version, path=request.path)
+        content = get_rendered_response(key)
+        if content is None:
+            response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            set_rendered_response(key, content)
+        return HttpResponse(content, content_type=request.accepted_media_type)
+
+    def list(self, request, *args, **kwargs):
+        return self.reference_response(
+            request,
+            lambda: super(VersionedReferenceMixin, self).list(
+                request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        # Объект ищется до ETag, чтобы на несуществующий пришел 404,
+        # а не 304.
+        instance = self.get_object()
+        return self.reference_response(
+            request,
+            lambda: Response(self.get_serializer(instance).data)
+        )
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(VersionedReferenceMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny, )
     pagination_class = None
+    version_key = TAGS_VERSION_KEY
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedReferenceMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny, )
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
     pagination_class = None
+    version_key = INGREDIENT_INDEX_VERSION_KEY
+
+    def list(self, request, *args, **kwargs):
+        """Отдает ингредиенты из индекса в памяти, не обращаясь к БД."""
+        name = request.query_params.get('name')
+        return self.reference_response(
+            request,
+            lambda: Response(
+                ingredient_index.search(name) if name
+                else ingredient_index.all())
+        )
 
 
 class RecipeViewSet(ModelViewSet):
     """Вьюсет для модели рецепта."""
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdmin,)
-    pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
-    def get_queryset(self):
-        queryset = Recipe.objects.all()
+    @property
+    def pagination_class(self):
+        """Включает keyset-пагинацию по ?pagination=cursor."""
+        params = self.request.query_params
+        if (params.get(PAGINATION_MODE_PARAM) == 'cursor'
+                or RecipeCursorPagination.cursor_query_param in params):
+            return RecipeCursorPagination
+        return CustomPagination
 
-        if self.request.user.is_authenticated:
-            favorite_subquery = Favorite.objects.filter(
-                user=self.request.user,
-                recipe=OuterRef('pk')
-            )
-            shopping_cart_subquery = ShoppingList.objects.filter(
-                user=self.request.user,
-                recipe=OuterRef('pk')
-            )
-            queryset = queryset.annotate(
-                is_favorited=Exists(favorite_subquery),
-                is_in_shopping_cart=Exists(shopping_cart_subquery)
-            )
-        else:
-            queryset = queryset.annotate(
-                is_favorited=Value(False, output_field=BooleanField()),
-                is_in_shopping_cart=Value(False, output_field=BooleanField())
+    def annotate_user_flags(self, queryset):
+        """Добавляет флаги текущего пользователя подзапросами EXISTS."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return (
+                false_flags(queryset, 'is_favorited', 'is_in_shopping_cart'),
+                false_flags(User.objects.all(), 'is_subscribed'),
             )
 
-        return queryset
+        favorite_subquery = Favorite.objects.filter(
+            user=user,
+            recipe=OuterRef('pk')
+        )
+        shopping_cart_subquery = ShoppingList.objects.filter(
+            user=user,
+            recipe=OuterRef('pk')
+        )
+        queryset = queryset.annotate(
+            is_favorited=Exists(favorite_subquery),
+            is_in_shopping_cart=Exists(shopping_cart_subquery)
+        )
+        authors = User.objects.annotate(
+            is_subscribed=Exists(Subscribe.objects.filter(
+                user=user,
+                author=OuterRef('pk')
+            ))
+        )
+        return queryset, authors
+
+    def get_queryset(self):
+        queryset = Recipe.objects.defer('search_vector').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+        queryset, authors = self.annotate_user_flags(queryset)
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors)
+        )
+
+    def get_validators_queryset(self):
+        """
+        Рецепты без prefetch: только то, от чего зависит ответ,
+        чтобы проверить If-None-Match одним легким запросом.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return anonymous_validators_queryset()
+        queryset, _ = self.annotate_user_flags(Recipe.objects.all())
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(user=user, author=OuterRef('author'))
+        ))
+
+    def list(self, request, *args, **kwargs):
+        """
+        Сначала выбирается только страница рецептов с полями для ETag
+        и флагами пользователя, без prefetch и по индексу. Авторы, теги
+        и ингредиенты загружаются только для рецептов, чьих фрагментов
+        нет в кэше.
+        """
+        page = self.paginate_queryset(self.filter_queryset(
+            self.get_state_queryset()))
+        envelope = self.paginator.get_paginated_response(None).data
+        etag = recipe_list_etag(
+            page, envelope, get_versions(*fragment_version_keys(page)))
+        return conditional_response(
+            request, etag, None,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = get_or_404(self.get_state_queryset(), pk=kwargs['pk'])
+        etag = make_etag(
+            *get_versions(
+                GENERATION_KEY, VERSION_KEY.format(pk=recipe.pk)),
+            *(getattr(recipe, field) for field in RECIPE_VALIDATOR_FIELDS)
+        )
+        # Без Last-Modified: флаги пользователя и счетчики меняются,
+        # не трогая updated_at.
+        return conditional_response(
+            request, etag, None,
+            lambda: Response(self.get_serializer(recipe).data)
+        )
+
+    def get_state_queryset(self):
+        return self.get_validators_queryset().only(*RECIPE_STATE_FIELDS)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -84,6 +291,7 @@ class RecipeViewSet(ModelViewSet):
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         """Метод для добавления/удаления из избранного."""
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -108,6 +316,7 @@ class RecipeViewSet(ModelViewSet):
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         """Метод для добавления/удаления из списка покупок."""
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -126,6 +335,53 @@ class RecipeViewSet(ModelViewSet):
         else:
             return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_batch(self, request):
+        """Пакетное добавление/удаление рецептов в избранном."""
+        return self.change_batch(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        """Пакетное добавление/удаление рецептов в списке покупок."""
+        return self.change_batch(ShoppingList, request)
+
+    def change_batch(self, model, request):
+        """
+        Добавляет или удаляет сразу несколько рецептов и возвращает
+        статус для каждого переданного id.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', flat=True))
+        if request.method == 'POST':
+            changed = bulk_add_relations(model, request.user, found)
+            statuses = ('added', 'already_added')
+        else:
+            changed = bulk_remove_relations(model, request.user, found)
+            statuses = ('removed', 'not_added')
+        results = []
+        for recipe_id in recipe_ids:
+            if recipe_id not in found:
+                result = 'not_found'
+            elif recipe_id in changed:
+                result = statuses[0]
+            else:
+                result = statuses[1]
+            results.append({'id': recipe_id, 'status': result})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
     def add_to(self, model, user, pk):
         """Метод для добавления."""
         if model.objects.filter(user=user, recipe__id=pk).exists():
@@ -150,32 +406,24 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        """Метод для скачивания списка покупок."""
+        """Метод для скачивания списка покупок в формате txt, csv или pdf."""
         user = request.user
         if not user.shopping_cart.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
-        )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
+        file_format = request.query_params.get(
+            SHOPPING_LIST_FORMAT_PARAM, 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: '
+                           f'{", ".join(SHOPPING_LIST_FORMATS)}'},
+                status=HTTP_400_BAD_REQUEST
+            )
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            render(user, get_shopping_list_rows(user)),
+            content_type=content_type
         )
+        filename = f'{user.username}_shopping_list.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
@@ -183,17 +431,30 @@ class RecipeViewSet(ModelViewSet):
 @api_view(['GET'])
 def get_short_link(request, recipe_id):
     """
-    Получение или создание короткой ссылки для рецепта.
+    Получение короткой ссылки для рецепта; код вычисляется из id.
     """
-    recipe = get_object_or_404(Recipe, id=recipe_id)
-    short_link, created = ShortLink.objects.get_or_create(recipe=recipe)
+    recipe = get_object_or_404(Recipe.objects.only('pk'), id=recipe_id)
+    short_link = ShortLink(
+        recipe=recipe, short_link=encode_short_link(recipe.pk))
     serializer = ShortLinkSerializer(short_link)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
+@require_safe
 def redirect_short_link(request, short_link):
-    """Перенаправляет на соответствующий рецепт по короткой ссылке."""
-    short_link_obj = get_object_or_404(ShortLink, short_link=short_link)
-    return redirect(f"/recipes/{short_link_obj.recipe.pk}/")
+    """
+    Перенаправляет на рецепт по короткой ссылке.
+
+    Обычная Django-вьюха без стека DRF: на популярные ссылки приходят
+    всплески трафика, а при попадании в кэш запрос не идет в БД.
+    """
+    recipe_id = resolve_short_link(short_link)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
+
+
+@require_safe
+def metrics(request):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,72 @@
+import sys
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.urls import URLResolver, get_resolver, reverse
+
+from .metrics import registry
+
+WARM_UP_URLS = ('api:tag-list', 'api:ingredient-list', 'api:recipe-list')
+
+
+def compile_patterns(resolver):
+    """Компилирует регулярные выражения всех маршрутов заранее."""
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            compile_patterns(pattern)
+
+
+def warm_up_host():
+    host = next(iter(settings.ALLOWED_HOSTS), '').lstrip('.')
+    return 'localhost' if host in ('', '*') else host
+
+
+def warm_up_environ(path):
+    """Окружение WSGI для GET-запроса к path, как от nginx."""
+    host = warm_up_host()
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host,
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+
+def warm_up():
+    """
+    Готовит процесс к приему запросов.
+
+    Компилирует маршруты и прогоняет запросы к справочникам и первой
+    странице рецептов через весь стек middleware: готовые ответы и
+    фрагменты рецептов попадают в кэши, индекс ингредиентов строится,
+    а ленивые импорты и регулярные выражения middleware выполняются
+    до первого настоящего запроса.
+    Соединения с БД закрываются, чтобы не достаться воркерам после fork.
+    """
+    resolver = get_resolver()
+    compile_patterns(resolver)
+    resolver.reverse_dict
+    handler = WSGIHandler()
+    try:
+        with registry.paused():
+            for name in WARM_UP_URLS:
+                response = handler(
+                    warm_up_environ(reverse(name)), lambda *args: None)
+                response.close()
+    finally:
+        connections.close_all()
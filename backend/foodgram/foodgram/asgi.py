@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+# Под ASGI каждый запрос получает свое соединение, постоянные соединения
+# копились бы до таймаута БД.
+os.environ.setdefault('CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -9,7 +9,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,10 +77,34 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Соединение живет между запросами и проверяется перед повторным
+        # использованием, а не открывается на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DB_ENGINE=sqlite — локальный запуск и тесты без PostgreSQL; поиск
+# рецептов в этом режиме работает по подстроке.
+if os.getenv('DB_ENGINE', 'postgresql').lower() == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -113,6 +138,15 @@ USE_L10N = True
 USE_TZ = True
 
 SITE_HOSTNAME = os.getenv('SITE_HOSTNAME', 'localhost')
+# Ключ перестановки кодов коротких ссылок. После выдачи первых ссылок
+# менять его нельзя: новые коды перестанут указывать на прежние рецепты.
+SHORT_LINK_KEY = os.getenv('SHORT_LINK_KEY', '')
+
+# Шрифт с кириллицей для PDF-списка покупок; DejaVu Sans лежит в репозитории.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    os.path.join(BASE_DIR, 'api', 'fonts', 'DejaVuSans.ttf')
+)
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
@@ -123,6 +157,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/backend-media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+IMAGE_DERIVATIVES_ASYNC = os.getenv(
+    'IMAGE_DERIVATIVES_ASYNC', 'True').lower() == 'true'
+IMAGE_DERIVATIVES_WORKERS = int(os.getenv('IMAGE_DERIVATIVES_WORKERS', 2))
+
+SERVER_TIMING_HEADER = os.getenv(
+    'SERVER_TIMING_HEADER', 'False').lower() == 'true'
+
+# Асинхронные вьюхи для частых анонимных запросов на чтение. Включается
+# в asgi.py; под WSGI они только добавили бы переключения потоков.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -135,7 +180,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
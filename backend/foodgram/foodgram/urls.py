@@ -3,15 +3,21 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-from api.views import redirect_short_link
+from api import async_views
+from api.views import metrics, redirect_short_link
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('s/<str:short_link>/', redirect_short_link,
          name='redirect_short_link'),
+    path('metrics', metrics, name='metrics'),
 ]
 
+if settings.ASYNC_VIEWS:
+    urlpatterns.insert(0, path('s/<str:short_link>/',
+                               async_views.redirect_short_link))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,105 @@
+"""
+Настройки gunicorn для продакшена.
+
+Число воркеров и потоков считается от доступных процессу ядер, любое
+значение можно переопределить переменными окружения. Несколько
+воркеров запускаются только с общим кэшем (REDIS_URL). Приложение
+загружается в мастер-процессе до fork: Django настраивается один раз,
+а прогретые маршруты и кэши справочников достаются всем воркерам,
+в том числе перезапущенным. Метрики воркеров пишутся в общий каталог
+PROMETHEUS_MULTIPROC_DIR, и /metrics отдает их сумму.
+"""
+import gc
+import os
+import shutil
+import sys
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+ASGI = os.getenv('GUNICORN_ASGI', 'False').lower() == 'true'
+
+bind = os.getenv('GUNICORN_BIND', '0:7000')
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count() * 2 + 1))
+if ASGI:
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # Те же значения по умолчанию, что в foodgram/asgi.py: без
+    # preload_app on_starting настраивает Django до импорта asgi.py,
+    # и воркеры получили бы настройки без асинхронных вьюх.
+    os.environ.setdefault('ASYNC_VIEWS', 'True')
+    os.environ.setdefault('CONN_MAX_AGE', '0')
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', 2))
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+
+# Задается до загрузки приложения: prometheus_client выбирает режим
+# хранения значений при импорте, а preload_app загружает приложение
+# раньше хука on_starting.
+METRICS_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram-metrics')
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def shared_cache():
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    django.setup()
+    from api.cache import is_shared_cache
+
+    return is_shared_cache()
+
+
+def on_starting(server):
+    # Файлы прошлого запуска удаляются: их счетчики относятся к
+    # процессам, которых уже нет.
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR)
+    # Версии кэша, снимки токенов и кэш справочников сбрасываются
+    # в кэше по умолчанию; в памяти процесса сброс не дойдет до других
+    # воркеров, и они будут отдавать устаревшие данные.
+    if server.cfg.workers > 1 and not shared_cache():
+        server.log.error(
+            'Several workers need a shared cache: set REDIS_URL '
+            'or run with GUNICORN_WORKERS=1.')
+        sys.exit(1)
+
+
+def warm_up(log):
+    from api.warmup import warm_up
+
+    try:
+        warm_up()
+    except Exception:
+        # Без прогрева кэши заполнятся первыми запросами; сервер должен
+        # стартовать и при недоступной БД или непримененных миграциях.
+        log.exception('Warm-up failed')
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        warm_up(server.log)
+        # Объекты мастера не обходятся сборщиком мусора в воркерах,
+        # поэтому их страницы памяти не копируются после fork.
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        warm_up(worker.log)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
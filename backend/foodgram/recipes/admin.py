@@ -2,6 +2,7 @@ from django import forms
 from django.contrib import admin
 
 from . import models
+from .shopping_cart import syncing_carts
 
 
 class IngredientsInlineFormset(forms.models.BaseInlineFormSet):
@@ -49,17 +50,19 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(models.Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'in_favorites')
+    list_display = ('id', 'name', 'author', 'favorites_count',
+                    'in_carts_count')
     list_editable = ('name',)
-    readonly_fields = ('in_favorites', )
+    list_select_related = ('author',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
     list_filter = ('tags',)
     inlines = [RecipeIngredientInline, ]
     search_fields = ('name', 'author', )
     empty_value_display = 'пусто'
 
-    @admin.display(description='В избранном')
-    def in_favorites(self, obj):
-        return obj.favorites.count()
+    def save_related(self, request, form, formsets, change):
+        with syncing_carts(form.instance.pk):
+            super().save_related(request, form, formsets, change)
 
 
 @admin.register(models.RecipeIngredient)
@@ -67,6 +70,19 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount')
     list_editable = ('recipe', 'ingredient', 'amount')
 
+    def save_model(self, request, obj, form, change):
+        with syncing_carts(obj.recipe_id, form.initial.get('recipe')):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with syncing_carts(obj.recipe_id):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = queryset.values_list('recipe_id', flat=True)
+        with syncing_carts(*recipe_ids):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(models.Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -78,3 +94,21 @@ class FavoriteAdmin(admin.ModelAdmin):
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
     list_editable = ('user', 'recipe')
+
+
+@admin.register(models.ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    """
+    Итоги корзин только для просмотра: их ведут сигналы корзины, а
+    правка вручную разойдется с рецептами в корзине.
+    """
+
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    list_select_related = ('user', 'ingredient')
+    readonly_fields = ('user', 'ingredient', 'amount')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
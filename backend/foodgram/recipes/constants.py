@@ -3,10 +3,64 @@ MAX_LENGTH_SLUG = 100
 MAX_LENGTH_TAG = 100
 MAX_LENGTH_NAME_INGREDIENT = 100
 MAX_LENGTH_UNIT = 50
-MAX_LENGTH_SHORTLINK = 3
+MAX_LENGTH_SHORTLINK = 16
 
 MAX_LENGTH_USER = 150
 MAX_LENGTH_EMAIL = 254
 MAX_LENGTH_ROLE = 20
 
 PAGE_PAGINATION = 6
+PAGINATION_MODE_PARAM = 'pagination'
+
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+INGREDIENT_INDEX_VERSION_KEY = 'ingredient-index-version'
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_TYPO_MIN_LENGTH = 3
+INGREDIENT_TYPO_MAX_DISTANCE = 2
+
+SHOPPING_LIST_FORMAT_PARAM = 'file_format'
+SHOPPING_LIST_CHUNK_SIZE = 2000
+SHOPPING_LIST_SPOOL_SIZE = 1024 * 1024
+SHOPPING_LIST_PDF_FONT_SIZE = 12
+
+IMAGE_DERIVATIVES_DIR = 'derivatives'
+IMAGE_SIZE_PARAM = 'image_size'
+IMAGE_SIZES = {
+    'small': (160, 160),
+    'medium': (480, 480),
+}
+# AVIF сохраняется, только если его умеет установленный Pillow
+# (см. recipes.images.output_formats).
+IMAGE_FORMATS = {
+    'avif': ('AVIF', {'quality': 60}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+SOURCE_KEY = 'source'
+
+RECIPE_BATCH_LIMIT = 100
+
+SHORT_LINK_MIN_LENGTH = 4
+SHORT_LINK_FEISTEL_ROUNDS = 4
+SHORT_LINK_LRU_SIZE = 10000
+SHORT_LINK_LRU_TIMEOUT = 60
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+REFERENCE_LRU_SIZE = 64
+REFERENCE_MAX_AGE = 60 * 60 * 24
+
+AUTH_TOKEN_LRU_SIZE = 10000
+AUTH_TOKEN_LRU_TIMEOUT = 5
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 5
+
+SEARCH_CONFIG = 'russian'
+SEARCH_MAX_LENGTH = 200
+
+METRICS_PREFIX = 'foodgram'
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+METRICS_METHODS = frozenset(
+    ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
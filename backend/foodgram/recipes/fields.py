@@ -0,0 +1,33 @@
+from django.db import models
+
+
+class SearchVectorField(models.Field):
+    """
+    Колонка tsvector для полнотекстового поиска.
+
+    В PostgreSQL это tsvector, в остальных БД — пустой текстовый столбец,
+    чтобы миграции и локальный запуск на SQLite не требовали
+    django.contrib.postgres и psycopg2.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'tsvector'
+        return 'text'
+
+
+@SearchVectorField.register_lookup
+class SearchMatch(models.Lookup):
+    """search_vector__match=SearchQuery(...) -> search_vector @@ tsquery."""
+
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ {rhs}', (*lhs_params, *rhs_params)
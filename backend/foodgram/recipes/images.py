@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .constants import (
+    IMAGE_DERIVATIVES_DIR, IMAGE_FORMATS, IMAGE_SIZES, SOURCE_KEY)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVES_WORKERS,
+            thread_name_prefix='image-derivatives'
+        )
+    return _executor
+
+
+@cache
+def output_formats():
+    """
+    Форматы копий, которые умеет сохранять установленный Pillow.
+
+    AVIF есть только в сборках с libavif (Pillow 11.2+ или плагин
+    pillow-avif-plugin); без него копии создаются в WebP и JPEG.
+    """
+    Image.init()
+    return {
+        extension: (image_format, options)
+        for extension, (image_format, options) in IMAGE_FORMATS.items()
+        if image_format in Image.SAVE
+    }
+
+
+def render_derivatives(field_file):
+    """Сохраняет уменьшенные копии изображения во всех форматах."""
+    storage = field_file.storage
+    with field_file.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    base = os.path.splitext(field_file.name)[0]
+    derivatives = {SOURCE_KEY: field_file.name}
+    for size, box in IMAGE_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(box, Image.LANCZOS)
+        for extension, (image_format, options) in output_formats().items():
+            variant = thumbnail
+            if image_format == 'JPEG':
+                variant = thumbnail.convert('RGB')
+            buffer = BytesIO()
+            variant.save(buffer, image_format, **options)
+            derivatives[f'{size}.{extension}'] = storage.save(
+                f'{IMAGE_DERIVATIVES_DIR}/{base}_{size}.{extension}',
+                ContentFile(buffer.getvalue())
+            )
+    return derivatives
+
+
+def delete_derivatives(storage, derivatives):
+    for key, name in derivatives.items():
+        if key != SOURCE_KEY:
+            storage.delete(name)
+
+
+def update_derivatives(model, pk, image_field, derivatives_field):
+    """
+    Пересоздает производные изображения для объекта.
+
+    Если изображение сменилось, пока шла обработка, результат
+    отбрасывается: для нового изображения запущена своя задача.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    field_file = getattr(instance, image_field)
+    old = getattr(instance, derivatives_field)
+    derivatives = render_derivatives(field_file) if field_file else {}
+    current = model.objects.filter(pk=pk).values_list(
+        image_field, flat=True).first()
+    if (current or None) != (field_file.name or None):
+        delete_derivatives(field_file.storage, derivatives)
+        return
+    setattr(instance, derivatives_field, derivatives)
+    instance.save(update_fields=[derivatives_field])
+    delete_derivatives(field_file.storage, old)
+
+
+def run_in_background(*args):
+    try:
+        update_derivatives(*args)
+    finally:
+        connections.close_all()
+
+
+def schedule_derivatives(instance, image_field, derivatives_field):
+    """Ставит пересоздание производных в очередь после коммита."""
+    field_file = getattr(instance, image_field)
+    derivatives = getattr(instance, derivatives_field)
+    if derivatives.get(SOURCE_KEY) == (field_file.name or None):
+        return
+    if not field_file:
+        if derivatives:
+            transaction.on_commit(lambda: update_derivatives(
+                type(instance), instance.pk, image_field, derivatives_field))
+        return
+    args = (type(instance), instance.pk, image_field, derivatives_field)
+    if settings.IMAGE_DERIVATIVES_ASYNC:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_background, *args))
+    else:
+        transaction.on_commit(lambda: update_derivatives(*args))
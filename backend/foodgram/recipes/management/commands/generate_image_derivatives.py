@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from recipes.constants import SOURCE_KEY
+from recipes.images import update_derivatives
+from recipes.models import Recipe
+from users.models import User
+
+BATCH_SIZE = 200
+
+TARGETS = (
+    (Recipe, 'image', 'image_derivatives'),
+    (User, 'avatar', 'avatar_derivatives'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails and WebP copies of uploaded images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate existing derivatives too')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for model, image_field, derivatives_field in TARGETS:
+            generated = failed = 0
+            objects = model.objects.exclude(
+                **{f'{image_field}__isnull': True}
+            ).exclude(
+                **{image_field: ''}
+            ).only(
+                'pk', image_field, derivatives_field
+            ).order_by('pk').iterator(chunk_size=options['batch_size'])
+            for instance in objects:
+                derivatives = getattr(instance, derivatives_field)
+                source = getattr(instance, image_field).name
+                if not options['force'] and (
+                        derivatives.get(SOURCE_KEY) == source):
+                    continue
+                try:
+                    update_derivatives(
+                        model, instance.pk, image_field, derivatives_field)
+                except OSError as error:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'{model.__name__} {instance.pk}: {error}'))
+                else:
+                    generated += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: generated {generated}, '
+                f'failed {failed}.'))
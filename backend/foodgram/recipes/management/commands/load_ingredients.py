@@ -1,55 +1,129 @@
 import csv
+import json
 import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from progress.bar import IncrementalBar
+from django.core.management.base import BaseCommand, CommandError
+from progress.counter import Counter
 
+from api.autocomplete import invalidate_ingredient_index
 from recipes.models import Ingredient
 
+BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+HEADER = ('name', 'measurement_unit')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if tuple(cell.strip() for cell in row[:2]) == HEADER:
+            continue
+        yield (row + ['', ''])[:2]
+
+
+def read_json(file):
+    """
+    Читает массив объектов по частям, не загружая файл целиком.
+
+    Если файл кончился раньше закрывающей скобки массива, JSON битый
+    или обрезан, и загрузка завершается ошибкой.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n[,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                if position < len(buffer):
+                    raise CommandError(f'Invalid JSON: {error.msg}.')
+                raise CommandError('Truncated JSON: "]" not found.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        yield [item.get('name'), item.get('measurement_unit')]
 
-def ingredient_create(row):
-    try:
-        Ingredient.objects.get_or_create(
-            name=row[0].strip(),
-            measurement_unit=row[1].strip()
-        )
-    except Exception as e:
-        print(f"Error creating ingredient {row}: {e}")
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
     help = "Load ingredients to DB"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.csv'))
+        parser.add_argument('--format', choices=READERS, default=None)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
     def handle(self, *args, **options):
-        path = os.path.join(settings.BASE_DIR, 'ingredients.csv')
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.'))
+        if file_format not in READERS:
+            raise CommandError(
+                f'Unknown file format "{file_format}", use csv or json.')
 
+        # Ошибки поднимаются как CommandError: команда завершается
+        # с ненулевым кодом, и скрипты развертывания видят сбой.
         try:
             with open(path, 'r', encoding='utf-8') as file:
-                reader = list(csv.reader(file))
-                row_count = len(reader) - 1
-                bar = IncrementalBar('ingredients.csv'.ljust(17),
-                                     max=row_count)
-                for row in reader[1:]:
-                    if len(row) < 2 or not row[0] or not row[1]:
-                        continue
-                    bar.next()
-                    ingredient_create(row)
-                bar.finish()
-            self.stdout.write(
-                self.style.SUCCESS(
-                    'The ingredients have been loaded successfully.'
-                )
-            )
-        except FileNotFoundError:
-            self.stdout.write(
-                self.style.ERROR(
-                    'File not found. Please check the path.'
-                )
-            )
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(
-                    f'An error occurred: {e}'
-                )
+                stats = self.load(READERS[file_format](file),
+                                  options['batch_size'])
+        except CommandError:
+            raise
+        except FileNotFoundError as error:
+            raise CommandError(
+                'File not found. Please check the path.') from error
+        except Exception as error:
+            raise CommandError(f'An error occurred: {error}') from error
+        invalidate_ingredient_index()
+        self.stdout.write(
+            self.style.SUCCESS(
+                'The ingredients have been loaded successfully: '
+                'inserted {inserted}, already present {existing}, '
+                'skipped {skipped}.'.format(**stats)
             )
+        )
+
+    def load(self, rows, batch_size):
+        stats = {'inserted': 0, 'existing': 0, 'skipped': 0}
+        total_before = Ingredient.objects.count()
+        loaded = 0
+        counter = Counter('ingredients ')
+        while batch := list(islice(rows, batch_size)):
+            ingredients = {}
+            for row in batch:
+                name, unit = (str(cell or '').strip() for cell in row)
+                if not name or not unit or (name, unit) in ingredients:
+                    stats['skipped'] += 1
+                    continue
+                ingredients[(name, unit)] = Ingredient(
+                    name=name, measurement_unit=unit)
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in ingredients}
+            ).values_list('name', 'measurement_unit'))
+            new = [ingredient for key, ingredient in ingredients.items()
+                   if key not in existing]
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+            loaded += len(ingredients)
+            counter.next(len(batch))
+        counter.finish()
+        # ignore_conflicts молча пропускает строки, которые повторяются
+        # в разных пачках или добавлены параллельно, поэтому число
+        # вставленных считается по таблице.
+        stats['inserted'] = Ingredient.objects.count() - total_before
+        stats['existing'] = loaded - stats['inserted']
+        return stats
@@ -0,0 +1,77 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+from recipes.shopping_cart import get_live_totals
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Rebuild shopping cart totals from RecipeIngredient'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare stored totals with the live aggregate.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            self.rebuild(options['batch_size'])
+        mismatches = self.verify()
+        if mismatches:
+            raise CommandError(
+                f'{mismatches} shopping cart totals differ '
+                'from the live aggregate.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Shopping cart totals match the live aggregate.'))
+
+    @transaction.atomic
+    def rebuild(self, batch_size):
+        ShoppingCartIngredient.objects.all().delete()
+        rows = (
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total)
+            for user_id, ingredient_id, total in get_live_totals().iterator(
+                chunk_size=batch_size)
+        )
+        created = 0
+        while batch := list(islice(rows, batch_size)):
+            ShoppingCartIngredient.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(f'Created {created} shopping cart totals.')
+
+    def verify(self):
+        live = get_live_totals().iterator()
+        stored = ShoppingCartIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).order_by('user_id', 'ingredient_id').iterator()
+        mismatches = 0
+        live_row, stored_row = next(live, None), next(stored, None)
+        while live_row or stored_row:
+            live_key = live_row[:2] if live_row else None
+            stored_key = stored_row[:2] if stored_row else None
+            if live_key == stored_key:
+                if live_row[2] != stored_row[2]:
+                    mismatches += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'user {live_key[0]}, ingredient {live_key[1]}: '
+                        f'stored {stored_row[2]}, live {live_row[2]}'))
+                live_row, stored_row = next(live, None), next(stored, None)
+            elif stored_key is None or (live_key and live_key < stored_key):
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(
+                    f'user {live_key[0]}, ingredient {live_key[1]}: '
+                    f'missing, live {live_row[2]}'))
+                live_row = next(live, None)
+            else:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(
+                    f'user {stored_key[0]}, ingredient {stored_key[1]}: '
+                    f'stored {stored_row[2]}, not in any cart'))
+                stored_row = next(stored, None)
+        return mismatches
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingList
+
+BATCH_SIZE = 1000
+
+
+def count_subquery(model):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recalculate drifted favorites_count and in_carts_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        checked = repaired = 0
+        while True:
+            pks = list(Recipe.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            checked += len(pks)
+            drifted = Recipe.objects.filter(pk__in=pks).alias(
+                actual_favorites=count_subquery(Favorite),
+                actual_in_carts=count_subquery(ShoppingList),
+            ).filter(
+                ~Q(favorites_count=F('actual_favorites'))
+                | ~Q(in_carts_count=F('actual_in_carts'))
+            ).values_list('pk', flat=True)
+            repaired += Recipe.objects.filter(pk__in=list(drifted)).update(
+                favorites_count=count_subquery(Favorite),
+                in_carts_count=count_subquery(ShoppingList),
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} recipes, repaired {repaired} counters.'))
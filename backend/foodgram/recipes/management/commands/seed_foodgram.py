@@ -0,0 +1,70 @@
+from time import perf_counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from api.autocomplete import invalidate_ingredient_index
+from api.cache import bump_fragment_generation, bump_tags_version
+from recipes.models import Ingredient
+from recipes.seeding import SEED_PASSWORD, DatasetGenerator
+
+BATCH_SIZE = 5000
+PROGRESS_EVERY = 100000
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, recipes and relations for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--subscriptions', type=float, default=3,
+            help='Average number of subscriptions per user.')
+        parser.add_argument(
+            '--favorites', type=float, default=5,
+            help='Average number of favorite recipes per user.')
+        parser.add_argument(
+            '--carts', type=float, default=2,
+            help='Average number of recipes in a shopping cart.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--images', action='store_true',
+            help='Give every recipe one shared placeholder image.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('At least one user is needed.')
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients')
+        self.started = perf_counter()
+        self.reported = {}
+        generator = DatasetGenerator(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            images=options['images'],
+            progress=self.report,
+        )
+        user_ids, recipe_ids = generator.generate(
+            users=options['users'],
+            recipes=options['recipes'],
+            subscriptions=options['subscriptions'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+        )
+        invalidate_ingredient_index()
+        bump_tags_version()
+        bump_fragment_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(user_ids)} users and {len(recipe_ids)} recipes '
+            f'in {perf_counter() - self.started:.1f} s. '
+            f'Password for all users: {SEED_PASSWORD}.'
+        ))
+
+    def report(self, stage, done):
+        last = self.reported.get(stage, 0)
+        if done - last >= PROGRESS_EVERY or last == 0:
+            self.reported[stage] = done
+            self.stdout.write(
+                f'[{perf_counter() - self.started:7.1f} s] {stage}: {done}')
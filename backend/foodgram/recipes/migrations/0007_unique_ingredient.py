@@ -0,0 +1,52 @@
+# Generated by Django 4.2.15 on 2026-10-18 05:37
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    related = (
+        (apps.get_model('recipes', 'RecipeIngredient'), 'recipe_id'),
+        (apps.get_model('recipes', 'ShoppingCartIngredient'), 'user_id'),
+    )
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep=Min('id'), count=Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in duplicates:
+        others = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['keep']).values_list('pk', flat=True))
+        for model, owner in related:
+            for row in model.objects.filter(ingredient_id__in=others):
+                kept = model.objects.filter(
+                    ingredient_id=group['keep'],
+                    **{owner: getattr(row, owner)}
+                ).first()
+                if kept:
+                    kept.amount += row.amount
+                    kept.save(update_fields=['amount'])
+                    row.delete()
+                else:
+                    row.ingredient_id = group['keep']
+                    row.save(update_fields=['ingredient'])
+        Ingredient.objects.filter(pk__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.15 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shortlink',
+            name='short_link',
+            field=models.CharField(blank=True, max_length=16, null=True, unique=True),
+        ),
+    ]
@@ -1,6 +1,3 @@
-import random
-from string import ascii_letters, digits
-
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
@@ -9,6 +6,8 @@ from django.db import models
 from .constants import (
     MAX_LENGTH_NAME_INGREDIENT, MAX_LENGTH_NAME_RECIPE, MAX_LENGTH_SHORTLINK,
     MAX_LENGTH_SLUG, MAX_LENGTH_TAG, MAX_LENGTH_UNIT)
+from .fields import SearchVectorField
+from .shortlinks import encode_short_link
 
 User = get_user_model()
 
@@ -26,6 +25,10 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient')
+        ]
 
     def __str__(self):
         return f'{self.name} ({self.measurement_unit})'
@@ -62,6 +65,8 @@ class Recipe(models.Model):
         verbose_name='Автор рецепта'
     )
     image = models.ImageField('Изображение', upload_to='recipes/images')
+    image_derivatives = models.JSONField(
+        'Уменьшенные копии изображения', default=dict, editable=False)
     text = models.TextField('Описание')
     cooking_time = models.PositiveIntegerField(
         'Время приготовления (мин)',
@@ -78,6 +83,11 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Ингредиенты'
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах', default=0, editable=False)
+    search_vector = SearchVectorField('Поисковый индекс')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -85,6 +95,10 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', 'id'],
+                         name='recipe_created_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -116,10 +130,6 @@ class RecipeIngredient(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['recipe', 'ingredient'],
                                     name='unique_recipe_ingredient'),
-            models.CheckConstraint(
-                check=models.Q(recipeingredients__isnull=False),
-                name='recipe_must_have_ingredients'
-            )
         ]
 
     def __str__(self):
@@ -192,8 +202,42 @@ class ShoppingList(models.Model):
         return f'{self.user} добавил "{self.recipe}" в свою корзину'
 
 
+class ShoppingCartIngredient(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_cart_ingredient')
+        ]
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
 class ShortLink(models.Model):
-    """Модель для хранения коротких ссылок на рецепты."""
+    """
+    Модель для хранения коротких ссылок на рецепты.
+
+    Новые коды вычисляются из id рецепта (см. shortlinks.py) и в таблицу
+    не записываются; здесь хранятся выданные раньше случайные коды.
+    """
 
     recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
                                   related_name='short_link')
@@ -202,15 +246,5 @@ class ShortLink(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.short_link:
-            self.short_link = self.generate_short_link()
+            self.short_link = encode_short_link(self.recipe_id)
         super().save(*args, **kwargs)
-
-    def generate_short_link(self):
-        """Генерирует уникальную короткую ссылку."""
-        length = MAX_LENGTH_SHORTLINK
-        characters = ascii_letters + digits
-        while True:
-            short_link = ''.join(random.choices(characters, k=length))
-            if not ShortLink.objects.filter(short_link=short_link).exists():
-                break
-        return short_link
@@ -0,0 +1,117 @@
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from .models import Favorite, Recipe, RecipeIngredient, ShoppingList
+from .shopping_cart import apply_cart_deltas
+
+User = get_user_model()
+
+# Пока идет пакетное удаление, счетчики и итоги корзины пересчитываются
+# одним запросом на все рецепты, а не сигналами каждой записи.
+bulk_change = ContextVar('bulk_change', default=False)
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingList: 'in_carts_count',
+}
+
+
+def change_recipe_counter(model, recipe_ids, delta):
+    field = RECIPE_COUNTERS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: F(field) + delta})
+
+
+def change_cart_totals(model, user, recipe_ids, sign):
+    if model is not ShoppingList or not recipe_ids:
+        return
+    amounts = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id').annotate(total=Sum('amount')).order_by()
+    apply_cart_deltas(
+        [user.pk],
+        {ingredient_id: sign * total for ingredient_id, total in amounts}
+    )
+
+
+def insert_rows(model, fields, rows, ignore_conflicts=False, returning=None):
+    """
+    Вставляет кортежи значений полей fields одним многострочным INSERT,
+    без объектов моделей и сигналов.
+
+    С ignore_conflicts уже существующие строки пропускаются (ON CONFLICT
+    DO NOTHING); с returning возвращаются значения этого поля у
+    вставленных строк.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(
+        quote(model._meta.get_field(field).column) for field in fields)
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    sql = (f'INSERT INTO {table} ({columns}) '
+           f'VALUES {", ".join([placeholders] * len(rows))}')
+    if ignore_conflicts:
+        sql += ' ON CONFLICT DO NOTHING'
+    if returning:
+        sql += f' RETURNING {quote(model._meta.get_field(returning).column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+        if returning:
+            return [value for value, in cursor.fetchall()]
+
+
+def insert_relations(model, user, recipe_ids):
+    """
+    Вставляет связи одним INSERT ... ON CONFLICT DO NOTHING и
+    возвращает id рецептов из строк, которые вставлены этим запросом,
+    а не пропущены из-за уже существующей или параллельно добавленной
+    записи.
+    """
+    if not recipe_ids:
+        return set()
+    return set(insert_rows(
+        model, ('user', 'recipe'),
+        [(user.pk, recipe_id) for recipe_id in recipe_ids],
+        ignore_conflicts=True, returning='recipe'))
+
+
+@transaction.atomic
+def bulk_add_relations(model, user, recipe_ids):
+    """
+    Добавляет рецепты в избранное или корзину одним INSERT.
+
+    Сигналы при этом не отправляются, поэтому счетчики рецептов и
+    итоги корзины обновляются здесь и только для действительно
+    вставленных строк. Возвращает множество добавленных id.
+    """
+    added = insert_relations(model, user, sorted(recipe_ids))
+    change_recipe_counter(model, added, 1)
+    change_cart_totals(model, user, added, 1)
+    return added
+
+
+@transaction.atomic
+def bulk_remove_relations(model, user, recipe_ids):
+    """
+    Удаляет рецепты из избранного или корзины.
+
+    Обработчики сигналов удаления отдельных записей на это время
+    отключаются через bulk_change: счетчики и итоги корзины
+    пересчитываются здесь сразу для всех рецептов. Возвращает
+    множество удаленных id.
+    """
+    relations = dict(model.objects.select_for_update().filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('pk', 'recipe_id'))
+    token = bulk_change.set(True)
+    try:
+        model.objects.filter(pk__in=relations).delete()
+    finally:
+        bulk_change.reset(token)
+    removed = set(relations.values())
+    change_recipe_counter(model, removed, -1)
+    change_cart_totals(model, user, removed, -1)
+    return removed
@@ -0,0 +1,77 @@
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from .constants import SEARCH_CONFIG
+from .models import Recipe, RecipeIngredient
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def search_document():
+    """
+    tsvector рецепта: название (вес A), ингредиенты (B), описание (C).
+
+    django.contrib.postgres импортируется здесь, а не на уровне модуля:
+    ему нужен psycopg2, которого может не быть при запуске на SQLite.
+    """
+    from django.contrib.postgres.aggregates import StringAgg
+    from django.contrib.postgres.search import SearchVector
+
+    ingredient_names = Coalesce(
+        Subquery(
+            RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        ),
+        Value(''),
+        output_field=TextField()
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """Пересчитывает search_vector одним UPDATE; вне PostgreSQL ничего."""
+    if is_postgresql():
+        queryset.update(search_vector=search_document())
+
+
+def schedule_search_update(**filters):
+    """Обновляет поисковый индекс после коммита, когда ингредиенты уже
+    записаны."""
+    transaction.on_commit(
+        lambda: update_search_vectors(Recipe.objects.filter(**filters)))
+
+
+def search_recipes(queryset, query):
+    """
+    Фильтрует рецепты по поисковому запросу.
+
+    В PostgreSQL используется websearch_to_tsquery по GIN-индексу и
+    сортировка по ts_rank. На других БД каждое слово ищется через
+    icontains в названии, описании и ингредиентах.
+    """
+    if is_postgresql():
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector__match=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-created_at', 'id')
+    for term in query.split():
+        queryset = queryset.filter(
+            Q(name__icontains=term)
+            | Q(text__icontains=term)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=term))
+        )
+    return queryset
@@ -0,0 +1,266 @@
+import random
+from array import array
+from collections import Counter
+from io import BytesIO, StringIO
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from PIL import Image, ImageDraw
+
+from users.models import Subscribe
+
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingList, Tag)
+from .relations import insert_rows
+from .search import update_search_vectors
+
+User = get_user_model()
+
+SEED_PASSWORD = 'foodgram-seed'
+SEED_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+SEED_UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+SEED_ADJECTIVES = (
+    'Домашний', 'Быстрый', 'Летний', 'Пряный', 'Сытный', 'Легкий',
+    'Бабушкин', 'Праздничный', 'Острый', 'Нежный',
+)
+SEED_DISHES = (
+    'суп', 'салат', 'пирог', 'плов', 'омлет', 'рагу', 'соус', 'десерт',
+    'гуляш', 'завтрак', 'сэндвич', 'смузи',
+)
+SEED_SENTENCES = (
+    'Подготовьте все ингредиенты заранее.',
+    'Нарежьте овощи небольшими кубиками.',
+    'Обжарьте на среднем огне до золотистого цвета.',
+    'Готовьте под крышкой, периодически помешивая.',
+    'Посолите и поперчите по вкусу.',
+    'Подавайте горячим, посыпав зеленью.',
+    'Дайте настояться несколько минут.',
+    'Запекайте в разогретой духовке.',
+)
+SEED_AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500)
+PLACEHOLDER_IMAGE = 'recipes/images/seed-placeholder.png'
+PLACEHOLDER_SIZE = (640, 480)
+
+
+def ensure_tags():
+    Tag.objects.bulk_create(
+        [Tag(name=name, slug=slug) for name, slug in SEED_TAGS],
+        ignore_conflicts=True
+    )
+    return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def ensure_ingredients(count):
+    """Досоздает синтетические ингредиенты, если справочник пуст."""
+    if not Ingredient.objects.exists():
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'ингредиент {number}',
+                measurement_unit=SEED_UNITS[number % len(SEED_UNITS)]
+            )
+            for number in range(count)
+        )
+    return array('q', Ingredient.objects.order_by('pk').values_list(
+        'pk', flat=True))
+
+
+def ensure_placeholder_image():
+    """
+    Один раз сохраняет картинку-заглушку, общую для всех рецептов.
+
+    Уменьшенные копии для нее не создаются: при смене изображения у
+    одного рецепта они удалились бы вместе с его старыми копиями.
+    """
+    if not default_storage.exists(PLACEHOLDER_IMAGE):
+        image = Image.new('RGB', PLACEHOLDER_SIZE, (236, 228, 214))
+        draw = ImageDraw.Draw(image)
+        width, height = PLACEHOLDER_SIZE
+        draw.ellipse(
+            (width // 4, height // 6, width * 3 // 4, height * 5 // 6),
+            fill=(214, 120, 62)
+        )
+        buffer = BytesIO()
+        image.save(buffer, 'PNG', optimize=True)
+        default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+    return PLACEHOLDER_IMAGE
+
+
+def batches(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+class DatasetGenerator:
+    """
+    Детерминированно наполняет БД пользователями, рецептами и связями.
+
+    Строки строятся генераторами и пишутся пакетами, так что в памяти
+    держатся только текущий пакет и массивы id. Популярность
+    авторов, рецептов, тегов и ингредиентов неравномерная: небольшая
+    часть получает большую часть связей. Сигналы при такой записи не
+    срабатывают, поэтому поисковый индекс обновляется после каждого
+    пакета рецептов, а счетчики и итоги корзин — в конце.
+    """
+
+    def __init__(self, seed=0, batch_size=1000, images=False,
+                 progress=None):
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.batch_size = batch_size
+        self.images = images
+        self.progress = progress or (lambda stage, done: None)
+        self.done = Counter()
+
+    def generate(self, users, recipes, subscriptions=3, favorites=5,
+                 carts=2, ingredients=500):
+        """
+        Создает users пользователей и recipes рецептов. Остальные
+        параметры — среднее число подписок, избранного и рецептов в
+        корзине на пользователя.
+        """
+        self.tag_ids = ensure_tags()
+        self.ingredient_ids = ensure_ingredients(ingredients)
+        self.random.shuffle(self.ingredient_ids)
+        self.image = ensure_placeholder_image() if self.images else ''
+        user_ids = self.create_users(users)
+        recipe_ids = self.create_recipes(user_ids, recipes)
+        self.create_relations(
+            Subscribe, 'author', user_ids, user_ids, subscriptions)
+        popular_ids = array('q', recipe_ids)
+        self.random.shuffle(popular_ids)
+        self.create_relations(
+            Favorite, 'recipe', user_ids, popular_ids, favorites)
+        self.create_relations(
+            ShoppingList, 'recipe', user_ids, popular_ids, carts)
+        self.rebuild_aggregates()
+        return user_ids, recipe_ids
+
+    def skewed(self, population, skew=2.5):
+        """Элемент с ближайшими к началу индексами в приоритете."""
+        return population[int(len(population) * self.random.random() ** skew)]
+
+    def skewed_sample(self, population, count, skew=2.5):
+        count = min(count, len(population))
+        chosen = set()
+        for _ in range(count * 4):
+            if len(chosen) == count:
+                break
+            chosen.add(self.skewed(population, skew))
+        return chosen
+
+    def average(self, mean, most):
+        if mean <= 0:
+            return 0
+        return min(int(self.random.expovariate(1 / mean)), most)
+
+    def advance(self, stage, count):
+        self.done[stage] += count
+        self.progress(stage, self.done[stage])
+
+    def write(self, model, rows, stage):
+        """Пишет объекты пакетами и возвращает созданные."""
+        for batch in batches(rows, self.batch_size):
+            with transaction.atomic():
+                objects = model.objects.bulk_create(batch)
+            self.advance(stage, len(objects))
+            yield objects
+
+    def insert(self, model, fields, rows, stage):
+        """
+        Вставляет кортежи значений многострочным INSERT, без объектов
+        моделей.
+
+        Для таблиц связей без сигналов и значений по умолчанию: на
+        создание объектов и подготовку значений в bulk_create уходит
+        большая часть времени.
+        """
+        size = min(self.batch_size, connection.ops.bulk_batch_size(
+            fields, [None] * self.batch_size))
+        for batch in batches(rows, size):
+            insert_rows(model, fields, batch)
+            self.advance(stage, len(batch))
+
+    def create_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        prefix = f'seed{self.seed}-{User.objects.count()}-'
+        rows = (
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}',
+                password=password,
+            )
+            for number in range(count)
+        )
+        user_ids = array('q')
+        for users in self.write(User, rows, 'users'):
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def recipe(self, author_ids):
+        rng = self.random
+        name = f'{rng.choice(SEED_ADJECTIVES)} {rng.choice(SEED_DISHES)}'
+        return Recipe(
+            author_id=self.skewed(author_ids),
+            name=name,
+            text=' '.join(rng.sample(SEED_SENTENCES, rng.randint(2, 5))),
+            image=self.image,
+            cooking_time=rng.choice((5, 10, 15, 20, 30, 45, 60, 90, 120)),
+        )
+
+    def create_recipes(self, user_ids, count):
+        rng = self.random
+        RecipeTag = Recipe.tags.through
+        rows = (self.recipe(user_ids) for _ in range(count))
+        recipe_ids = array('q')
+        for recipes in self.write(Recipe, rows, 'recipes'):
+            batch_ids = [recipe.pk for recipe in recipes]
+            with transaction.atomic():
+                self.insert(RecipeTag, ('recipe', 'tag'), (
+                    (recipe_id, tag_id)
+                    for recipe_id in batch_ids
+                    for tag_id in self.skewed_sample(
+                        self.tag_ids, 1 + (rng.random() < 0.3), skew=1.5)
+                ), 'recipe tags')
+                self.insert(
+                    RecipeIngredient, ('recipe', 'ingredient', 'amount'), (
+                        (recipe_id, ingredient_id, rng.choice(SEED_AMOUNTS))
+                        for recipe_id in batch_ids
+                        for ingredient_id in self.skewed_sample(
+                            self.ingredient_ids, rng.randint(3, 12))
+                    ), 'recipe ingredients')
+                update_search_vectors(Recipe.objects.filter(pk__in=batch_ids))
+            recipe_ids.extend(batch_ids)
+        return recipe_ids
+
+    def create_relations(self, model, target, user_ids, target_ids, mean):
+        """Связывает пользователей с популярными авторами или рецептами."""
+        rows = (
+            (user_id, target_id)
+            for user_id in user_ids
+            for target_id in self.skewed_sample(
+                target_ids, self.average(mean, mean * 10))
+            if target_id != user_id or target != 'author'
+        )
+        with transaction.atomic():
+            self.insert(
+                model, ('user', target), rows,
+                model._meta.verbose_name_plural)
+
+    def rebuild_aggregates(self):
+        output = StringIO()
+        call_command('repair_recipe_counters', stdout=output)
+        self.advance('counters', 1)
+        call_command('rebuild_shopping_carts', stdout=output)
+        self.advance('shopping carts', 1)
@@ -0,0 +1,107 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingCartIngredient, ShoppingList
+
+User = get_user_model()
+
+
+def get_recipe_amounts(recipe_id):
+    """Возвращает {ingredient_id: amount} для рецепта."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def get_live_totals():
+    """Считает содержимое корзин заново по RecipeIngredient."""
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values_list(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    )
+
+
+@transaction.atomic
+def apply_cart_deltas(user_ids, deltas):
+    """
+    Прибавляет deltas {ingredient_id: количество} к корзинам user_ids.
+
+    Строки пользователей блокируются, чтобы параллельные изменения
+    одной корзины не теряли обновления.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    user_ids = sorted(set(user_ids))
+    if not deltas or not user_ids:
+        return
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    rows = {
+        (row.user_id, row.ingredient_id): row
+        for row in ShoppingCartIngredient.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas)
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas.items():
+            row = rows.get((user_id, ingredient_id))
+            if row is None:
+                if delta > 0:
+                    to_create.append(ShoppingCartIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=delta
+                    ))
+                continue
+            row.amount += delta
+            if row.amount > 0:
+                to_update.append(row)
+            else:
+                to_delete.append(row.pk)
+    ShoppingCartIngredient.objects.bulk_create(to_create)
+    ShoppingCartIngredient.objects.bulk_update(to_update, ['amount'])
+    ShoppingCartIngredient.objects.filter(pk__in=to_delete).delete()
+
+
+def add_recipe_to_cart(user_id, recipe_id):
+    apply_cart_deltas([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe_from_cart(user_id, recipe_id):
+    apply_cart_deltas([user_id], {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+    })
+
+
+def apply_recipe_deltas(recipe_id, deltas):
+    """Прибавляет изменение ингредиентов рецепта к корзинам с ним."""
+    apply_cart_deltas(
+        ShoppingList.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True),
+        deltas
+    )
+
+
+def sync_recipe_in_carts(recipe_id, old_amounts):
+    """Переносит изменение ингредиентов рецепта в корзины с этим рецептом."""
+    deltas = Counter(get_recipe_amounts(recipe_id))
+    deltas.subtract(old_amounts)
+    apply_recipe_deltas(recipe_id, deltas)
+
+
+@contextmanager
+def syncing_carts(*recipe_ids):
+    """Синхронизирует корзины после изменения ингредиентов рецептов."""
+    old_amounts = {
+        pk: get_recipe_amounts(pk) for pk in set(recipe_ids) if pk}
+    yield
+    for recipe_id, amounts in old_amounts.items():
+        sync_recipe_in_carts(recipe_id, amounts)
@@ -0,0 +1,88 @@
+import hashlib
+import hmac
+from string import ascii_letters, digits
+
+from django.conf import settings
+
+from .constants import SHORT_LINK_FEISTEL_ROUNDS, SHORT_LINK_MIN_LENGTH
+
+ALPHABET = digits + ascii_letters
+BASE = len(ALPHABET)
+INDEX = {char: position for position, char in enumerate(ALPHABET)}
+
+
+def code_length(recipe_id):
+    """Длина кода растет сама, когда id перестает помещаться."""
+    length = SHORT_LINK_MIN_LENGTH
+    while recipe_id >= BASE ** length:
+        length += 1
+    return length
+
+
+def round_function(key, length, round_number, value, bits):
+    digest = hmac.new(
+        key, f'{length}:{round_number}:{value}'.encode(), hashlib.sha256
+    ).digest()
+    return int.from_bytes(digest[:8], 'big') & ((1 << bits) - 1)
+
+
+def permute(value, length, key, inverse=False):
+    """
+    Ключевая перестановка чисел [0, BASE ** length).
+
+    Сеть Фейстеля работает на ближайшем сверху домене из 2 ** (2 * half)
+    чисел, а выходящие за BASE ** length значения прогоняются повторно
+    (cycle walking), поэтому перестановка остается взаимно однозначной.
+    """
+    size = BASE ** length
+    half = (size.bit_length() + 1) // 2
+    mask = (1 << half) - 1
+    rounds = range(SHORT_LINK_FEISTEL_ROUNDS)
+    while True:
+        left, right = value >> half, value & mask
+        if inverse:
+            for round_number in reversed(rounds):
+                left, right = right ^ round_function(
+                    key, length, round_number, left, half), left
+        else:
+            for round_number in rounds:
+                left, right = right, left ^ round_function(
+                    key, length, round_number, right, half)
+        value = (left << half) | right
+        if value < size:
+            return value
+
+
+def encode_short_link(recipe_id):
+    """Переводит id рецепта в код base62 без обращений к БД."""
+    length = code_length(recipe_id)
+    value = recipe_id
+    if settings.SHORT_LINK_KEY:
+        value = permute(value, length, settings.SHORT_LINK_KEY.encode())
+    code = ''
+    while value:
+        value, remainder = divmod(value, BASE)
+        code = ALPHABET[remainder] + code
+    return code.rjust(length, ALPHABET[0])
+
+
+def decode_short_link(code):
+    """
+    Возвращает id рецепта по коду или None, если код не из этой схемы.
+
+    Коды короче SHORT_LINK_MIN_LENGTH выдавались старым генератором
+    случайных ссылок и ищутся в таблице ShortLink.
+    """
+    if len(code) < SHORT_LINK_MIN_LENGTH:
+        return None
+    value = 0
+    for char in code:
+        if char not in INDEX:
+            return None
+        value = value * BASE + INDEX[char]
+    if settings.SHORT_LINK_KEY:
+        value = permute(
+            value, len(code), settings.SHORT_LINK_KEY.encode(), inverse=True)
+    if value < 1 or code_length(value) != len(code):
+        return None
+    return value
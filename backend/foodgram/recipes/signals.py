@@ -0,0 +1,84 @@
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .images import schedule_derivatives
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingList)
+from .relations import bulk_change, change_recipe_counter
+from .search import schedule_search_update
+from .shopping_cart import add_recipe_to_cart, remove_recipe_from_cart
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingList)
+def remember_old_relation(sender, instance, **kwargs):
+    """Запоминает прежние пользователя и рецепт при изменении записи."""
+    instance._old_relation = None
+    if instance.pk is None:
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'recipe_id').first()
+    if old and old != (instance.user_id, instance.recipe_id):
+        instance._old_relation = old
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_relation', None)
+    if old:
+        change_recipe_counter(sender, [old[1]], -1)
+    if created or old:
+        change_recipe_counter(sender, [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    if bulk_change.get():
+        return
+    change_recipe_counter(sender, [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_to_cart_totals(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_relation', None)
+    if old:
+        remove_recipe_from_cart(*old)
+    if created or old:
+        add_recipe_to_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def remove_from_cart_totals(sender, instance, **kwargs):
+    if bulk_change.get():
+        return
+    remove_recipe_from_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_derivatives(sender, instance, update_fields, **kwargs):
+    if update_fields and 'image' not in update_fields:
+        return
+    schedule_derivatives(instance, 'image', 'image_derivatives')
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    schedule_search_update(pk=instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_ingredients_search_vector(sender, instance, **kwargs):
+    schedule_search_update(pk=instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_renamed_ingredient_search_vectors(sender, instance, created,
+                                             **kwargs):
+    if not created:
+        schedule_search_update(recipeingredients__ingredient=instance.pk)
@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from users.models import User
+
+from .constants import IMAGE_SIZES, SHORT_LINK_MIN_LENGTH, SOURCE_KEY
+from .images import output_formats, render_derivatives
+from .models import Ingredient, Recipe
+from .shortlinks import BASE, decode_short_link, encode_short_link, permute
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+INGREDIENTS = [
+    {'name': 'Мука', 'measurement_unit': 'г'},
+    {'name': 'Соль', 'measurement_unit': 'г'},
+    {'name': 'Мука', 'measurement_unit': 'г'},
+]
+
+
+class LoadIngredientsTest(TestCase):
+
+    def load(self, content, *args):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.json', encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        stdout = StringIO()
+        call_command('load_ingredients', file.name, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_counts_inserted_rows(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        output = self.load(json.dumps(INGREDIENTS), '--batch-size=2')
+        self.assertIn('inserted 1, already present 2, skipped 0', output)
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_truncated_json(self):
+        content = json.dumps(INGREDIENTS)
+        for broken in (content[:-1], content[:-10], content[:-10] + '}]'):
+            with self.subTest(content=broken[-12:]):
+                with self.assertRaises(CommandError):
+                    self.load(broken)
+
+    def test_errors(self):
+        # Элемент массива не объект: ошибка вне разбора JSON.
+        with self.assertRaises(CommandError):
+            self.load('[1]')
+        for path in ('/nonexistent/ingredients.csv', __file__):
+            with self.subTest(path=path):
+                with self.assertRaises(CommandError):
+                    call_command('load_ingredients', path, stdout=StringIO())
+        self.assertFalse(Ingredient.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDerivativesTest(TestCase):
+    """Уменьшенные копии изображений и их догенерация командой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(buffer, 'PNG')
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password-12345')
+        # Копии создаются после коммита, а в setUpTestData его нет:
+        # рецепт остается без копий.
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image=SimpleUploadedFile(
+                'image.png', buffer.getvalue(), content_type='image/png'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, *args):
+        stdout = StringIO()
+        call_command('generate_image_derivatives', *args, stdout=stdout)
+        self.recipe.refresh_from_db()
+        return stdout.getvalue()
+
+    def test_render_derivatives(self):
+        derivatives = render_derivatives(self.recipe.image)
+        self.assertEqual(derivatives.pop(SOURCE_KEY), self.recipe.image.name)
+        self.assertEqual(set(derivatives), {
+            f'{size}.{extension}'
+            for size in IMAGE_SIZES for extension in output_formats()})
+        for key, name in derivatives.items():
+            size, extension = key.split('.')
+            with self.subTest(key=key), default_storage.open(name) as file:
+                image = Image.open(file)
+                self.assertEqual(
+                    image.format, output_formats()[extension][0])
+                self.assertEqual(image.width, IMAGE_SIZES[size][0])
+                self.assertLessEqual(image.height, IMAGE_SIZES[size][1])
+
+    def test_backfill(self):
+        self.assertIn('Рецепты: generated 1, failed 0', self.generate())
+        derivatives = self.recipe.image_derivatives
+        self.assertEqual(derivatives[SOURCE_KEY], self.recipe.image.name)
+
+        # Копии текущего изображения уже есть: рецепт пропускается.
+        self.assertIn('Рецепты: generated 0, failed 0', self.generate())
+        self.assertEqual(self.recipe.image_derivatives, derivatives)
+
+        self.assertIn(
+            'Рецепты: generated 1, failed 0', self.generate('--force'))
+        self.assertNotEqual(self.recipe.image_derivatives, derivatives)
+        for key, name in derivatives.items():
+            if key != SOURCE_KEY:
+                self.assertFalse(default_storage.exists(name))
+
+
+class ShortLinkCodeTest(TestCase):
+    """Коды коротких ссылок вычисляются из id и обратно без БД."""
+
+    key = b'secret'
+
+    def test_permute(self):
+        for length in (1, 2):
+            values = range(BASE ** length)
+            with self.subTest(length=length):
+                permuted = [permute(value, length, self.key)
+                            for value in values]
+                self.assertEqual(sorted(permuted), list(values))
+                self.assertNotEqual(permuted, list(values))
+                self.assertEqual(
+                    [permute(value, length, self.key, inverse=True)
+                     for value in permuted], list(values))
+
+    def test_round_trip(self):
+        ids = [*range(1, 3000), *range(BASE ** 4 - 100, BASE ** 4 + 100)]
+        for key in ('', 'secret'):
+            with self.subTest(key=key), override_settings(SHORT_LINK_KEY=key):
+                codes = [encode_short_link(recipe_id) for recipe_id in ids]
+                self.assertEqual(len(set(codes)), len(ids))
+                self.assertEqual(
+                    [decode_short_link(code) for code in codes], ids)
+
+    @override_settings(SHORT_LINK_KEY='secret')
+    def test_length_grows(self):
+        for recipe_id, length in ((1, SHORT_LINK_MIN_LENGTH),
+                                  (BASE ** 4 - 1, 4),
+                                  (BASE ** 4, 5),
+                                  (BASE ** 5, 6)):
+            with self.subTest(recipe_id=recipe_id):
+                code = encode_short_link(recipe_id)
+                self.assertEqual(len(code), length)
+                self.assertEqual(decode_short_link(code), recipe_id)
+
+    @override_settings(SHORT_LINK_KEY='secret')
+    def test_invalid_codes(self):
+        code = encode_short_link(42)
+        for invalid in (code[:-1] + '-', code[:-1] + '!', 'абвг', ' ' + code):
+            with self.subTest(code=invalid):
+                self.assertIsNone(decode_short_link(invalid))
+
+    def test_legacy_codes(self):
+        # Короткие коды старого генератора ищутся в таблице ShortLink.
+        for code in ('a', 'Ab', 'xY7'):
+            with self.subTest(code=code):
+                self.assertIsNone(decode_short_link(code))
@@ -47,6 +47,11 @@ class User(AbstractUser):
         null=True,
         blank=True,
     )
+    avatar_derivatives = models.JSONField(
+        'Уменьшенные копии аватара',
+        default=dict,
+        editable=False,
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from recipes.images import schedule_derivatives
+
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def update_avatar_derivatives(sender, instance, update_fields, **kwargs):
+    if update_fields and 'avatar' not in update_fields:
+        return
+    schedule_derivatives(instance, 'avatar', 'avatar_derivatives')
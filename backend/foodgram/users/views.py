@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.db.models import BooleanField, Count, F, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -9,6 +11,7 @@ from rest_framework.response import Response
 from api.pagination import CustomPagination
 from api.serializers import (
     AvatarSerializer, CustomUserSerializer, SubscribeSerializer)
+from recipes.models import Recipe
 
 from .models import Subscribe
 
@@ -21,6 +24,11 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
 
+    def get_serializer_class(self):
+        if self.action in ('subscribe', 'subscriptions'):
+            return SubscribeSerializer
+        return super().get_serializer_class()
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -43,8 +51,7 @@ class CustomUserViewSet(UserViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             Subscribe.objects.create(user=user, author=author)
-            serializer = SubscribeSerializer(author,
-                                             context={'request': request})
+            serializer = self.get_serializer(author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
@@ -63,13 +70,31 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
-        """Метод для просмотра подписок на авторов."""
+        """
+        Метод для просмотра подписок на авторов.
+
+        Число рецептов считается в том же запросе, а первые recipes_limit
+        рецептов каждого автора подгружаются одним запросом с ROW_NUMBER().
+        """
         user = request.user
-        queryset = User.objects.filter(subscribing__user=user)
+        recipes = Recipe.objects.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('created_at').desc(), F('id').asc())
+            )
+        ).order_by('author', 'row_number')
+        limit = request.query_params.get('recipes_limit', '')
+        if limit.isdigit():
+            recipes = recipes.filter(row_number__lte=int(limit))
+        queryset = User.objects.filter(subscribing__user=user).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('id').prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
         pages = self.paginate_queryset(queryset)
-        serializer = SubscribeSerializer(pages,
-                                         many=True,
-                                         context={'request': request})
+        serializer = self.get_serializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(detail=False, url_path='me', permission_classes=(IsAuthenticated,))